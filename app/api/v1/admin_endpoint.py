@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.dependencies.utiles import get_admin_key
+from app.services import breaker_registry
+
+import logging
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(get_admin_key)])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/circuit-breakers")
+async def list_circuit_breakers():
+    return {
+        "breakers": breaker_registry.snapshot(),
+        "fallbacks": breaker_registry.fallback_chains,
+    }
+
+
+@router.post("/circuit-breakers/{bot_name}/reset")
+async def reset_circuit_breaker(bot_name: str):
+    snapshot = breaker_registry.snapshot()
+    if bot_name not in snapshot:
+        raise HTTPException(status_code=404, detail=f"No circuit breaker for bot {bot_name}")
+
+    breaker_registry.get(bot_name).reset()
+    logger.info(f"Circuit breaker for bot {bot_name} reset by admin")
+    return {bot_name: breaker_registry.get(bot_name).snapshot()}
@@ -0,0 +1,148 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from app.models.openai_batches import BatchCreateRequest
+from app.dependencies.instance import get_file_store, get_batch_manager
+from app.dependencies.utiles import get_api_key
+from app.api.v1.poe_endpoint import run_batch_request
+from app.utils import FileStore, BatchManager, owner_of
+from functools import partial
+from typing import Optional
+
+import logging
+
+
+router = APIRouter(prefix="/v1")
+logger = logging.getLogger(__name__)
+
+
+@router.post("/files")
+async def upload_file(
+    file: UploadFile = File(...),
+    purpose: str = Form(...),
+    poe_api_key: str = Depends(get_api_key),
+    file_store: FileStore = Depends(get_file_store)
+):
+    if purpose != "batch":
+        raise HTTPException(status_code=400, detail="Only files with purpose 'batch' are supported.")
+
+    file_object = await run_in_threadpool(
+        file_store.save_upload, file.file, file.filename or "upload.jsonl", purpose, owner_of(poe_api_key)
+    )
+    return file_object.to_dict()
+
+
+@router.get("/files")
+async def list_files(
+    purpose: Optional[str] = None,
+    poe_api_key: str = Depends(get_api_key),
+    file_store: FileStore = Depends(get_file_store)
+):
+    files = await run_in_threadpool(file_store.list, owner_of(poe_api_key), purpose)
+    return {"object": "list", "data": [file_object.to_dict() for file_object in files]}
+
+
+@router.get("/files/{file_id}")
+async def retrieve_file(
+    file_id: str,
+    poe_api_key: str = Depends(get_api_key),
+    file_store: FileStore = Depends(get_file_store)
+):
+    file_object = await run_in_threadpool(file_store.get, file_id, owner_of(poe_api_key))
+    if file_object is None:
+        raise HTTPException(status_code=404, detail=f"File '{file_id}' not found.")
+    return file_object.to_dict()
+
+
+@router.get("/files/{file_id}/content")
+async def retrieve_file_content(
+    file_id: str,
+    poe_api_key: str = Depends(get_api_key),
+    file_store: FileStore = Depends(get_file_store)
+):
+    path = await run_in_threadpool(file_store.content_path, file_id, owner_of(poe_api_key))
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"File '{file_id}' not found.")
+    return FileResponse(path, media_type="application/jsonl")
+
+
+@router.delete("/files/{file_id}")
+async def delete_file(
+    file_id: str,
+    poe_api_key: str = Depends(get_api_key),
+    file_store: FileStore = Depends(get_file_store)
+):
+    if not await run_in_threadpool(file_store.delete, file_id, owner_of(poe_api_key)):
+        raise HTTPException(status_code=404, detail=f"File '{file_id}' not found.")
+    return {"id": file_id, "object": "file", "deleted": True}
+
+
+@router.post("/batches")
+async def create_batch(
+    request: Request,
+    batch_request: BatchCreateRequest,
+    poe_api_key: str = Depends(get_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager)
+):
+    state = request.app.state
+    execute = partial(
+        run_batch_request,
+        poe_api_key=poe_api_key,
+        image_manager=state.image_manager,
+        http_client=state.http_client,
+        admission_scheduler=state.admission_scheduler,
+        response_cache=state.response_cache,
+        stream_coalescer=state.stream_coalescer,
+        conversation_store=state.conversation_store
+    )
+    batch = await batch_manager.create(
+        input_file_id=batch_request.input_file_id,
+        endpoint=batch_request.endpoint,
+        completion_window=batch_request.completion_window,
+        metadata=batch_request.metadata,
+        concurrency=batch_request.concurrency,
+        owner=owner_of(poe_api_key),
+        execute=execute
+    )
+    return batch.to_dict()
+
+
+@router.get("/batches")
+async def list_batches(
+    after: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    poe_api_key: str = Depends(get_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager)
+):
+    batches, has_more = await run_in_threadpool(batch_manager.list, owner_of(poe_api_key), after, limit)
+    return {
+        "object": "list",
+        "data": [batch.to_dict() for batch in batches],
+        "first_id": batches[0].id if batches else None,
+        "last_id": batches[-1].id if batches else None,
+        "has_more": has_more
+    }
+
+
+@router.get("/batches/{batch_id}")
+async def retrieve_batch(
+    batch_id: str,
+    poe_api_key: str = Depends(get_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager)
+):
+    batch = await run_in_threadpool(batch_manager.get, batch_id, owner_of(poe_api_key))
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found.")
+    return batch.to_dict()
+
+
+@router.post("/batches/{batch_id}/cancel")
+async def cancel_batch(
+    batch_id: str,
+    poe_api_key: str = Depends(get_api_key),
+    batch_manager: BatchManager = Depends(get_batch_manager)
+):
+    batch = await run_in_threadpool(batch_manager.cancel, batch_id, owner_of(poe_api_key))
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found.")
+    return batch.to_dict()
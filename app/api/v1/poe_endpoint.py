@@ -1,51 +1,201 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
 from app.models.request_models import ClientRequest
-from app.dependencies.instance import get_image_manager
-from app.dependencies.utiles import get_api_key
-from fastapi.responses import StreamingResponse, JSONResponse
+from app.dependencies.instance import get_image_manager, get_http_client, get_admission_scheduler, get_response_cache
+from app.dependencies.instance import get_stream_coalescer, get_conversation_store
+from app.dependencies.utiles import get_api_key, get_cache_control, get_client_request
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
 from app.services import get_poe_response_streaming, get_poe_response_non_streaming
 from app.services import get_poe_chat_completion_non_streaming, get_poe_chat_completion_streaming
+from app.services import PoeApiHandler
 from app.utils import to_poe_message
 from app.utils import ImageManager
+from app.utils import coalesce_sse_frames
+from app.utils import AdmissionScheduler, AdmissionTicket
+from app.utils import ResponseCache, StreamCoalescer, ConversationStore
+from app.utils import instrument_stream, record_validation
+from app.utils import CancellableStreamingResponse, cancel_on_disconnect
+from app.utils import tracing
+from app.utils import owner_of
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
+import fastapi_poe as fp
+import httpx
 import logging
+import time
+import uuid
 
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def _streaming_response(
+    ticket: AdmissionTicket,
+    frames: AsyncIterator,
+    headers: Optional[Dict[str, str]] = None
+) -> CancellableStreamingResponse:
+    # The admission slot is held until the body is fully sent; the
+    # background task covers bodies that never start iterating.
+    return CancellableStreamingResponse(
+        ticket.hold(coalesce_sse_frames(frames)),
+        media_type="text/event-stream",
+        headers=headers,
+        background=BackgroundTask(ticket.release)
+    )
+
+
+async def _resolve_text_source(
+    request_data: ClientRequest,
+    protocol_messages: List[fp.ProtocolMessage],
+    poe_api_key: str,
+    http_client: httpx.AsyncClient,
+    response_cache: ResponseCache,
+    stream_coalescer: StreamCoalescer,
+    cache_control: Set[str]
+) -> Tuple[AsyncIterator[str], Dict[str, str]]:
+    """Pick where the reply text comes from: cache, a shared stream or Poe.
+
+    `Cache-Control: no-cache` skips the cache lookup but refreshes the
+    entry; `no-store` bypasses both the cache and single-flight coalescing.
+    """
+    cacheable = response_cache.is_cacheable(request_data.temperature)
+    coalescable = stream_coalescer.is_coalescable(request_data.temperature)
+    headers: Dict[str, str] = {}
+
+    if "no-store" in cache_control:
+        if cacheable:
+            response_cache.bypass()
+            headers["X-Cache"] = "BYPASS"
+        cacheable = coalescable = False
+
+    def _upstream() -> AsyncIterator[str]:
+        poe_handler = PoeApiHandler(poe_api_key, request_data.model, session=http_client)
+        text_chunks = poe_handler.stream_content(messages=protocol_messages, temperature=request_data.temperature)
+        if not cacheable:
+            return text_chunks
+        # A reply from a fallback bot must not be replayed as `model`'s.
+        return response_cache.record(
+            cache_key, text_chunks, store_if=lambda: poe_handler.served_bot_name == request_data.model
+        )
+
+    if not cacheable and not coalescable:
+        return _upstream(), headers
+
+    cache_key = response_cache.make_key(
+        request_data.model, protocol_messages, request_data.temperature, owner_of(poe_api_key)
+    )
+    if cacheable:
+        if "no-cache" in cache_control:
+            response_cache.bypass()
+        else:
+            chunks = await response_cache.get(cache_key)
+            if chunks is not None:
+                return response_cache.replay(chunks), {"X-Cache": "HIT"}
+        headers["X-Cache"] = "MISS"
+
+    if not coalescable:
+        return _upstream(), headers
+
+    text_source, joined = stream_coalescer.subscribe(cache_key, _upstream)
+    headers["X-Single-Flight"] = "JOINED" if joined else "LEADER"
+    return text_source, headers
+
+
+async def _rehydrate_input(
+    request_data: ClientRequest,
+    conversation_store: ConversationStore,
+    poe_api_key: str,
+    image_manager: ImageManager,
+    http_client: httpx.AsyncClient
+) -> Tuple[List[fp.ProtocolMessage], str]:
+    with tracing.span("messages.convert"):
+        protocol_messages, instructions_str = await to_poe_message(request_data.input, poe_api_key, image_manager, http_client)
+    if not request_data.previous_response_id:
+        return protocol_messages, instructions_str
+
+    stored = await conversation_store.load(owner_of(poe_api_key), request_data.previous_response_id)
+    if stored is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Previous response with id '{request_data.previous_response_id}' not found."
+        )
+
+    history, stored_instructions = stored
+    if not any(msg.role == "system" for msg in request_data.input):
+        instructions_str = stored_instructions
+    return history + protocol_messages, instructions_str
+
+
 @router.post(
         "/v1/responses",
         response_model=None
 )
 async def create_model_responses(
-    request_data: ClientRequest,
+    request: Request,
+    request_data: ClientRequest = Depends(get_client_request),
     poe_api_key: str = Depends(get_api_key),
-    image_manager: ImageManager = Depends(get_image_manager)
+    image_manager: ImageManager = Depends(get_image_manager),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    admission_scheduler: AdmissionScheduler = Depends(get_admission_scheduler),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    stream_coalescer: StreamCoalescer = Depends(get_stream_coalescer),
+    conversation_store: ConversationStore = Depends(get_conversation_store),
+    cache_control: Set[str] = Depends(get_cache_control)
 ):
-    protocol_messages, instructions_str = await to_poe_message(request_data.input, poe_api_key, image_manager)
+    record_validation()
+    started_at = time.perf_counter()
+    with tracing.span("admission.wait"):
+        ticket = await admission_scheduler.acquire(poe_api_key, request_data.service_tier)
+    try:
+        protocol_messages, instructions_str = await _rehydrate_input(
+            request_data, conversation_store, poe_api_key, image_manager, http_client
+        )
+        text_source, cache_headers = await _resolve_text_source(
+            request_data, protocol_messages, poe_api_key, http_client,
+            response_cache, stream_coalescer, cache_control
+        )
+        text_source = instrument_stream(text_source, request_data.model, "/v1/responses", started_at)
 
-    if request_data.stream:
-        return StreamingResponse(
-            get_poe_response_streaming(
+        response_id = f"resp-{uuid.uuid4().hex}"
+        if request_data.store:
+            text_source = conversation_store.record(
+                owner_of(poe_api_key), response_id, protocol_messages, instructions_str, text_source
+            )
+
+        if request_data.stream:
+            return _streaming_response(ticket, get_poe_response_streaming(
                 bot_name=request_data.model,
                 poe_api_key=poe_api_key,
                 protocol_messages=protocol_messages,
                 instructions_str=instructions_str,
                 request_model_name=request_data.model,
-            ),
-            media_type="text/event-stream"
-        )
-    else:
-        response = await get_poe_response_non_streaming(
-            bot_name=request_data.model,
-            poe_api_key=poe_api_key,
-            protocol_messages=protocol_messages,
-            instructions_str=instructions_str,
-            request_model_name=request_data.model,
-            )
-        return JSONResponse(response)
+                temperature=request_data.temperature,
+                session=http_client,
+                text_source=text_source,
+                response_id=response_id,
+                previous_response_id=request_data.previous_response_id,
+                store=request_data.store,
+            ), cache_headers)
+        else:
+            response = await cancel_on_disconnect(request, get_poe_response_non_streaming(
+                bot_name=request_data.model,
+                poe_api_key=poe_api_key,
+                protocol_messages=protocol_messages,
+                instructions_str=instructions_str,
+                request_model_name=request_data.model,
+                temperature=request_data.temperature,
+                session=http_client,
+                text_source=text_source,
+                response_id=response_id,
+                previous_response_id=request_data.previous_response_id,
+                store=request_data.store,
+            ))
+            ticket.release()
+            return JSONResponse(response, headers=cache_headers)
+    except BaseException:
+        ticket.release()
+        raise
 
 
 @router.post(
@@ -53,27 +203,118 @@ async def create_model_responses(
         response_model=None
 )
 async def create_model_chat_completions(
-    request_data: ClientRequest,
+    request: Request,
+    request_data: ClientRequest = Depends(get_client_request),
     poe_api_key: str = Depends(get_api_key),
-    image_manager: ImageManager = Depends(get_image_manager)
+    image_manager: ImageManager = Depends(get_image_manager),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+    admission_scheduler: AdmissionScheduler = Depends(get_admission_scheduler),
+    response_cache: ResponseCache = Depends(get_response_cache),
+    stream_coalescer: StreamCoalescer = Depends(get_stream_coalescer),
+    cache_control: Set[str] = Depends(get_cache_control)
 ):
-    protocol_messages, _ = await to_poe_message(request_data.input, poe_api_key, image_manager)
+    record_validation()
+    started_at = time.perf_counter()
+    with tracing.span("admission.wait"):
+        ticket = await admission_scheduler.acquire(poe_api_key, request_data.service_tier)
+    try:
+        with tracing.span("messages.convert"):
+            protocol_messages, _ = await to_poe_message(request_data.input, poe_api_key, image_manager, http_client)
+        text_source, cache_headers = await _resolve_text_source(
+            request_data, protocol_messages, poe_api_key, http_client,
+            response_cache, stream_coalescer, cache_control
+        )
+        text_source = instrument_stream(text_source, request_data.model, "/v1/chat/completions", started_at)
 
-    if request_data.stream:
-        return StreamingResponse(
-            get_poe_chat_completion_streaming(
+        if request_data.stream:
+            return _streaming_response(ticket, get_poe_chat_completion_streaming(
                 bot_name=request_data.model,
                 poe_api_key=poe_api_key,
                 protocol_messages=protocol_messages,
                 request_model_name=request_data.model,
-            ),
-            media_type="text/event-stream"
+                temperature=request_data.temperature,
+                session=http_client,
+                text_source=text_source,
+            ), cache_headers)
+        else:
+            response = await cancel_on_disconnect(request, get_poe_chat_completion_non_streaming(
+                bot_name=request_data.model,
+                poe_api_key=poe_api_key,
+                protocol_messages=protocol_messages,
+                request_model_name=request_data.model,
+                temperature=request_data.temperature,
+                session=http_client,
+                text_source=text_source,
+            ))
+            ticket.release()
+            return JSONResponse(response, headers=cache_headers)
+    except BaseException:
+        ticket.release()
+        raise
+
+
+async def run_batch_request(
+    endpoint: str,
+    request_data: ClientRequest,
+    poe_api_key: str,
+    image_manager: ImageManager,
+    http_client: httpx.AsyncClient,
+    admission_scheduler: AdmissionScheduler,
+    response_cache: ResponseCache,
+    stream_coalescer: StreamCoalescer,
+    conversation_store: ConversationStore
+) -> Dict[str, Any]:
+    """Non-streaming reply to one batch line, as the endpoints would give it.
+
+    Batch lines queue in the `flex` lane unless they name a service tier,
+    so interactive traffic on the same key goes first.
+    """
+    started_at = time.perf_counter()
+    ticket = await admission_scheduler.acquire(poe_api_key, request_data.service_tier or "flex")
+    try:
+        if endpoint == "/v1/responses":
+            protocol_messages, instructions_str = await _rehydrate_input(
+                request_data, conversation_store, poe_api_key, image_manager, http_client
+            )
+        else:
+            with tracing.span("messages.convert"):
+                protocol_messages, instructions_str = await to_poe_message(
+                    request_data.input, poe_api_key, image_manager, http_client
+                )
+        text_source, _ = await _resolve_text_source(
+            request_data, protocol_messages, poe_api_key, http_client,
+            response_cache, stream_coalescer, set()
         )
-    else:
-        response =  await get_poe_chat_completion_non_streaming(
+        text_source = instrument_stream(text_source, request_data.model, endpoint, started_at)
+
+        if endpoint == "/v1/chat/completions":
+            return await get_poe_chat_completion_non_streaming(
+                bot_name=request_data.model,
+                poe_api_key=poe_api_key,
+                protocol_messages=protocol_messages,
+                request_model_name=request_data.model,
+                temperature=request_data.temperature,
+                session=http_client,
+                text_source=text_source,
+            )
+
+        response_id = f"resp-{uuid.uuid4().hex}"
+        if request_data.store:
+            text_source = conversation_store.record(
+                owner_of(poe_api_key), response_id, protocol_messages, instructions_str, text_source
+            )
+        return await get_poe_response_non_streaming(
             bot_name=request_data.model,
             poe_api_key=poe_api_key,
             protocol_messages=protocol_messages,
+            instructions_str=instructions_str,
             request_model_name=request_data.model,
-            )
-        return JSONResponse(response)
+            temperature=request_data.temperature,
+            session=http_client,
+            text_source=text_source,
+            response_id=response_id,
+            previous_response_id=request_data.previous_response_id,
+            store=request_data.store,
+        )
+    finally:
+        ticket.release()
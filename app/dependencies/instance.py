@@ -1,6 +1,37 @@
 from fastapi import Request
-from app.utils import ImageManager
+from app.utils import ImageManager, AdmissionScheduler, ResponseCache, StreamCoalescer, ConversationStore
+from app.utils import FileStore, BatchManager
+
+import httpx
 
 
 def get_image_manager(request: Request) -> ImageManager:
-    return request.app.state.image_manager
\ No newline at end of file
+    return request.app.state.image_manager
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http_client
+
+
+def get_admission_scheduler(request: Request) -> AdmissionScheduler:
+    return request.app.state.admission_scheduler
+
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.response_cache
+
+
+def get_stream_coalescer(request: Request) -> StreamCoalescer:
+    return request.app.state.stream_coalescer
+
+
+def get_conversation_store(request: Request) -> ConversationStore:
+    return request.app.state.conversation_store
+
+
+def get_file_store(request: Request) -> FileStore:
+    return request.app.state.file_store
+
+
+def get_batch_manager(request: Request) -> BatchManager:
+    return request.app.state.batch_manager
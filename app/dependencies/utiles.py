@@ -1,5 +1,13 @@
-from fastapi import Header, HTTPException
-from typing import Optional
+from fastapi import Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from app.models.request_models import ClientRequest
+from app.utils import decode_client_request
+from typing import Optional, Set
+
+import orjson
+import os
+import secrets
 
 
 def _extract_api_key(
@@ -25,4 +33,50 @@ async def get_api_key(
     if not extracted_api_key:
         raise HTTPException(status_code=401, detail="API key required")
 
-    return extracted_api_key
\ No newline at end of file
+    return extracted_api_key
+
+async def get_admin_key(
+    authorization: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None, alias="x-api-key"),
+    api_key: Optional[str] = Header(None, alias="api-key"),
+) -> str:
+    admin_api_key = os.getenv('ADMIN_API_KEY')
+    if not admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    extracted_api_key = _extract_api_key(authorization, x_api_key, api_key)
+    if not extracted_api_key or not secrets.compare_digest(extracted_api_key, admin_api_key):
+        raise HTTPException(status_code=403, detail="Invalid admin API key")
+
+    return extracted_api_key
+
+
+async def get_cache_control(
+    cache_control: Optional[str] = Header(None, alias="cache-control"),
+) -> Set[str]:
+    if not cache_control:
+        return set()
+    return {directive.split("=", 1)[0].strip().lower() for directive in cache_control.split(",")}
+
+
+async def get_client_request(request: Request) -> ClientRequest:
+    """Decode the request body with the zero-copy fast path.
+
+    Errors are reported like FastAPI's own body validation (422).
+    """
+    body = await request.body()
+    try:
+        return decode_client_request(body)
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid",
+            "loc": ("body", e.pos),
+            "msg": "JSON decode error",
+            "input": {},
+            "ctx": {"error": e.msg}
+        }], body=body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+            body=body
+        )
@@ -1,7 +1,11 @@
 from app.api.v1.poe_endpoint import router as responses_router
-from fastapi import FastAPI
+from app.api.v1.admin_endpoint import router as admin_router
+from app.api.v1.batch_endpoint import router as batch_router
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
-from app.utils import ImageManager
+from app.utils import ImageManager, AdmissionScheduler, ResponseCache, StreamCoalescer, ConversationStore, create_http_client
+from app.utils import TracingMiddleware, RequestSizeMiddleware, render_metrics, mark_worker_stopped
+from app.utils import warm_up, FileStore, BatchManager
 
 
 import uvicorn
@@ -21,14 +25,40 @@ logger = logging.getLogger(__name__)
 async def create_instance(app: FastAPI):
     logger.info("Initializing singleton instances...")
     image_manager_instance = ImageManager()
+    await image_manager_instance.connect()
     app.state.image_manager = image_manager_instance
+    http_client_instance = create_http_client()
+    app.state.http_client = http_client_instance
+    app.state.admission_scheduler = AdmissionScheduler()
+    app.state.response_cache = ResponseCache(image_manager_instance.redis_client)
+    app.state.conversation_store = ConversationStore(image_manager_instance.redis_client)
+    stream_coalescer_instance = StreamCoalescer()
+    app.state.stream_coalescer = stream_coalescer_instance
+    file_store_instance = FileStore()
+    app.state.file_store = file_store_instance
+    batch_manager_instance = BatchManager(file_store_instance)
+    batch_manager_instance.recover()
+    app.state.batch_manager = batch_manager_instance
     logger.info("Singleton instances are all created and loaded")
+    # uvicorn only starts accepting connections once this returns.
+    app.state.warmup = await warm_up(image_manager_instance, http_client_instance, app)
 
     yield
 
+    await batch_manager_instance.close()
+    await stream_coalescer_instance.close()
+    await http_client_instance.aclose()
+    await image_manager_instance.close()
+    mark_worker_stopped()
+    logger.info("Singleton instances are all released")
+
 
 app = FastAPI(lifespan=create_instance)
 app.include_router(responses_router)
+app.include_router(admin_router)
+app.include_router(batch_router)
+app.add_middleware(RequestSizeMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 @app.get("/")
@@ -37,5 +67,11 @@ async def root():
     return {"message": "API is running", "endpoint": "/"}
 
 
+@app.get("/metrics")
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=2026)
\ No newline at end of file
@@ -0,0 +1,64 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from .openai_responses import CustomBaseModel
+
+
+class FileObject(CustomBaseModel):
+    id: str
+    object: str = "file"
+    bytes: int
+    created_at: int
+    filename: str
+    purpose: str
+    status: str = "processed"
+    status_details: Optional[str] = None
+
+
+class BatchRequestCounts(CustomBaseModel):
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+
+
+class BatchError(CustomBaseModel):
+    code: str
+    message: str
+    param: Optional[str] = None
+    line: Optional[int] = None
+
+
+class BatchErrors(CustomBaseModel):
+    object: str = "list"
+    data: List[BatchError] = Field(default_factory=list)
+
+
+class Batch(CustomBaseModel):
+    id: str
+    object: str = "batch"
+    endpoint: str
+    errors: Optional[BatchErrors] = None
+    input_file_id: str
+    completion_window: str
+    status: str
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    created_at: int
+    in_progress_at: Optional[int] = None
+    expires_at: Optional[int] = None
+    finalizing_at: Optional[int] = None
+    completed_at: Optional[int] = None
+    failed_at: Optional[int] = None
+    expired_at: Optional[int] = None
+    cancelling_at: Optional[int] = None
+    cancelled_at: Optional[int] = None
+    request_counts: BatchRequestCounts = Field(default_factory=BatchRequestCounts)
+    metadata: Optional[Dict[str, str]] = None
+
+
+class BatchCreateRequest(BaseModel):
+    input_file_id: str
+    endpoint: str
+    completion_window: str = "24h"
+    metadata: Optional[Dict[str, str]] = None
+    # Not part of the OpenAI API: requests of this batch run at once.
+    concurrency: Optional[int] = None
@@ -99,7 +99,7 @@ class Response(CustomBaseModel):
     incomplete_details: Optional[Any] = None
     max_output_tokens: Optional[Any] = None
     parallel_tool_calls: Optional[bool] = True
-    previous_response_id: Optional[int] = None
+    previous_response_id: Optional[str] = None
     reasoning: Dict[str, None] = Field(default_factory=lambda: {"effort": None, "summary": None})
     store: Optional[bool] = True
     text: Dict[str, Dict[str, str]] = Field(default_factory=lambda: {"format": {"type": "text"}})
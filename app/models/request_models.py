@@ -23,6 +23,9 @@ class ClientRequest(BaseModel):
     input: List[ClientInput] = Field(default_factory=list)
     stream: bool = False
     service_tier: Optional[str] = None
+    temperature: Optional[float] = None
+    previous_response_id: Optional[str] = None
+    store: bool = True
 
     @classmethod
     def _transform_content_item(cls, item: Dict) -> Dict:
@@ -0,0 +1,79 @@
+"""Run the proxy with several worker processes on one host.
+
+    python -m app.serve --workers 8 --port 2026
+
+Workers share the attachment and token count caches through mmap-ed
+files in a shared-memory directory, so an image uploaded by one worker
+is a local hit for all of them. Prometheus samples are written to the
+same directory, so /metrics reports the whole server whichever worker
+answers it. Everything else (admission limits, circuit breakers,
+single-flight) stays per worker.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import uvicorn
+
+
+logger = logging.getLogger(__name__)
+
+
+def _default_shared_dir() -> str:
+    # /dev/shm keeps the segments in RAM; elsewhere the page cache does.
+    parent = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    return tempfile.mkdtemp(prefix="poe-to-openai-", dir=parent)
+
+
+def _reset_metrics_dir(path: str) -> None:
+    # Samples left over from a previous run would be added to this one.
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=2026)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--loop", default="uvloop")
+    parser.add_argument("--http", default="httptools")
+    parser.add_argument(
+        "--shared-cache-dir",
+        help="directory for the shared cache segments; kept on exit (default: a new one, removed on exit)"
+    )
+    args = parser.parse_args(argv)
+
+    if sys.platform == "win32":
+        parser.error("shared caches need fcntl; run uvicorn with --workers 1 on Windows")
+
+    shared_dir = args.shared_cache_dir or _default_shared_dir()
+    os.makedirs(shared_dir, exist_ok=True)
+    # Read by the workers when they import app.utils.
+    os.environ["SHARED_CACHE_DIR"] = shared_dir
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        metrics_dir = os.path.join(shared_dir, "metrics")
+        _reset_metrics_dir(metrics_dir)
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info(f"Starting {args.workers} workers sharing caches in {shared_dir}")
+
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            loop=args.loop,
+            http=args.http
+        )
+    finally:
+        if args.shared_cache_dir is None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from .poe_response_service import get_poe_response_streaming, get_poe_response_non_streaming
 from .poe_chat_completion_service import get_poe_chat_completion_non_streaming, get_poe_chat_completion_streaming
+from ._circuit_breaker import breaker_registry
+from ._poe_api_handler import PoeApiHandler, stream_bot_text
 
 __version__ = "1.0.0"
 
@@ -7,5 +9,8 @@ __all__ = [
     "get_poe_response_streaming",
     "get_poe_response_non_streaming",
     "get_poe_chat_completion_non_streaming",
-    "get_poe_chat_completion_streaming"
+    "get_poe_chat_completion_streaming",
+    "breaker_registry",
+    "PoeApiHandler",
+    "stream_bot_text"
 ]
\ No newline at end of file
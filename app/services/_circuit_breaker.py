@@ -0,0 +1,207 @@
+from collections import OrderedDict, deque
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+
+import json
+import logging
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Bot names come from the client; cap how many breakers are kept.
+BREAKER_MAX_BOTS = int(os.getenv('BREAKER_MAX_BOTS', '1000'))
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Error-rate and slow-TTFT breaker over a sliding time window.
+
+    The breaker opens when, with at least `min_requests` samples in the
+    window, the failure rate or the share of calls whose first token took
+    longer than `slow_ttft_seconds` crosses its threshold. After
+    `open_seconds` it lets `half_open_probes` calls through; one success
+    closes it again, one failure reopens it.
+    """
+
+    def __init__(
+        self,
+        bot_name: str,
+        window_seconds: float = float(os.getenv('BREAKER_WINDOW_SECONDS', '60')),
+        min_requests: int = int(os.getenv('BREAKER_MIN_REQUESTS', '10')),
+        failure_rate_threshold: float = float(os.getenv('BREAKER_FAILURE_RATE', '0.5')),
+        slow_ttft_seconds: float = float(os.getenv('BREAKER_SLOW_TTFT_SECONDS', '30')),
+        slow_rate_threshold: float = float(os.getenv('BREAKER_SLOW_RATE', '0.8')),
+        open_seconds: float = float(os.getenv('BREAKER_OPEN_SECONDS', '30')),
+        half_open_probes: int = int(os.getenv('BREAKER_HALF_OPEN_PROBES', '1'))
+    ):
+        self.bot_name = bot_name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_ttft_seconds = slow_ttft_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_started_at = 0.0
+        # (timestamp, succeeded, ttft seconds or None)
+        self._samples: Deque[Tuple[float, bool, Optional[float]]] = deque()
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.window_seconds
+        while self._samples and self._samples[0][0] < horizon:
+            self._samples.popleft()
+
+    def _rates(self) -> Tuple[float, float]:
+        total = len(self._samples)
+        if not total:
+            return 0.0, 0.0
+        failures = sum(1 for _, ok, _ in self._samples if not ok)
+        slow = sum(1 for _, ok, ttft in self._samples if ok and ttft is not None and ttft > self.slow_ttft_seconds)
+        return failures / total, slow / total
+
+    def _transition(self, state: BreakerState, now: float) -> None:
+        if state is self.state:
+            return
+        logger.warning(f"Circuit breaker for bot {self.bot_name}: {self.state.value} -> {state.value}")
+        self.state = state
+        self._probes_in_flight = 0
+        if state is BreakerState.OPEN:
+            self._opened_at = now
+        elif state is BreakerState.CLOSED:
+            self._samples.clear()
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state is BreakerState.OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(BreakerState.HALF_OPEN, now)
+
+        if self.state is BreakerState.CLOSED:
+            return True
+        if self.state is BreakerState.HALF_OPEN:
+            # A probe that never reported back (e.g. the client went away)
+            # must not wedge the breaker half-open forever.
+            if now - self._probe_started_at >= self.open_seconds:
+                self._probes_in_flight = 0
+            if self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                self._probe_started_at = now
+                return True
+        return False
+
+    def _record(self, succeeded: bool, ttft: Optional[float]) -> None:
+        now = time.monotonic()
+
+        if self.state is BreakerState.HALF_OPEN:
+            slow = ttft is not None and ttft > self.slow_ttft_seconds
+            self._transition(BreakerState.CLOSED if succeeded and not slow else BreakerState.OPEN, now)
+            return
+
+        self._samples.append((now, succeeded, ttft))
+        self._prune(now)
+        if self.state is BreakerState.CLOSED and len(self._samples) >= self.min_requests:
+            failure_rate, slow_rate = self._rates()
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_rate_threshold:
+                self._transition(BreakerState.OPEN, now)
+
+    def record_success(self, ttft: Optional[float] = None) -> None:
+        self._record(True, ttft)
+
+    def record_failure(self) -> None:
+        self._record(False, None)
+
+    def record_ignored(self) -> None:
+        """Close out a call whose failure says nothing about the bot, e.g. a rejected key."""
+        if self.state is BreakerState.HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def reset(self) -> None:
+        self._transition(BreakerState.CLOSED, time.monotonic())
+
+    def snapshot(self) -> Dict[str, object]:
+        self._prune(time.monotonic())
+        failure_rate, slow_rate = self._rates()
+        ttfts = sorted(ttft for _, ok, ttft in self._samples if ok and ttft is not None)
+        return {
+            "state": self.state.value,
+            "window_requests": len(self._samples),
+            "failure_rate": round(failure_rate, 3),
+            "slow_rate": round(slow_rate, 3),
+            "ttft_p50_seconds": round(ttfts[len(ttfts) // 2], 3) if ttfts else None,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Breakers by bot name, least recently used first.
+
+    Beyond `max_bots` the least recently used closed breaker is dropped
+    (or the least recently used one, if none is closed); a dropped bot
+    simply starts over with a fresh breaker.
+    """
+
+    def __init__(self, fallback_chains: Optional[Dict[str, List[str]]] = None, max_bots: int = None):
+        if max_bots is None:
+            max_bots = BREAKER_MAX_BOTS
+
+        self.max_bots = max_bots
+        self._breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+        self.fallback_chains = fallback_chains if fallback_chains is not None else load_fallback_chains()
+
+    def get(self, bot_name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(bot_name)
+        if breaker is not None:
+            self._breakers.move_to_end(bot_name)
+            return breaker
+
+        breaker = self._breakers[bot_name] = CircuitBreaker(bot_name)
+        if len(self._breakers) > self.max_bots:
+            self._evict()
+        return breaker
+
+    def _evict(self) -> None:
+        for bot_name, breaker in self._breakers.items():
+            if breaker.state is BreakerState.CLOSED:
+                del self._breakers[bot_name]
+                return
+        self._breakers.popitem(last=False)
+
+    def candidates(self, bot_name: str) -> List[str]:
+        chain = [bot_name]
+        for fallback in self.fallback_chains.get(bot_name, []):
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        return {bot_name: breaker.snapshot() for bot_name, breaker in self._breakers.items()}
+
+
+def load_fallback_chains() -> Dict[str, List[str]]:
+    """Read POE_FALLBACK_BOTS, a JSON object mapping a bot to its fallbacks."""
+    raw = os.getenv('POE_FALLBACK_BOTS', '')
+    if not raw:
+        return {}
+
+    try:
+        chains = json.loads(raw)
+        return {str(bot): [str(fallback) for fallback in fallbacks] for bot, fallbacks in chains.items()}
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.error(f"Ignoring invalid POE_FALLBACK_BOTS: {e}")
+        return {}
+
+
+breaker_registry = CircuitBreakerRegistry()
@@ -1,43 +1,201 @@
 import logging
 import fastapi_poe as fp
 
-from typing import List
+from fastapi_poe.client import PROTOCOL_VERSION
+
+from typing import AsyncIterator, Dict, List, Optional
+from ._retry_policy import DEFAULT_RETRY_POLICY, RetryPolicy, is_retryable, retry_counters
+from ._circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, breaker_registry
+from app.utils.http_client import last_upstream_status, POE_BOT_BASE_URL
+from app.utils.metrics import UPSTREAM_ERRORS, CANCELLED_GENERATIONS, CANCELLED_SECONDS_SAVED, model_label
+from app.utils import tracing
+
+import asyncio
+import httpx
+import time
 
 
 logger = logging.getLogger(__name__)
 
+# Smoothed duration of completed generations per bot, used to estimate
+# how much upstream time cancelling an abandoned one saved. Keyed by
+# metric label, so it is bounded like the metrics it feeds.
+GENERATION_SECONDS_ALPHA = 0.2
+_generation_seconds: Dict[str, float] = {}
+
+
+def _record_generation(bot_name: str, seconds: float) -> None:
+    label = model_label(bot_name)
+    previous = _generation_seconds.get(label)
+    _generation_seconds[label] = seconds if previous is None else previous + GENERATION_SECONDS_ALPHA * (seconds - previous)
+
+
+def _record_cancellation(bot_name: str, elapsed: float) -> None:
+    label = model_label(bot_name)
+    CANCELLED_GENERATIONS.labels(label).inc()
+    expected = _generation_seconds.get(label)
+    if expected is not None and expected > elapsed:
+        CANCELLED_SECONDS_SAVED.labels(label).inc(expected - elapsed)
+    logger.info(f"Cancelled generation from bot {bot_name} after {elapsed:.2f}s")
+
+
+def _build_query(messages: List[fp.ProtocolMessage], **kwargs) -> fp.QueryRequest:
+    # What `fp.get_bot_response` sends; unset parameters keep their defaults.
+    params = {name: value for name, value in kwargs.items() if value is not None}
+    return fp.QueryRequest(
+        query=messages,
+        user_id="",
+        conversation_id="",
+        message_id="",
+        version=PROTOCOL_VERSION,
+        type="query",
+        skip_system_prompt=True,
+        **params
+    )
+
 
 class PoeApiHandler:
     def __init__(
         self,
         initial_key: str,
-        bot_name: str
+        bot_name: str,
+        session: Optional[httpx.AsyncClient] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breakers: Optional[CircuitBreakerRegistry] = None
     ):
         self._api_key = initial_key
         self._bot_name = bot_name
+        self._session = session
+        self._retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+        self._breakers = breakers or breaker_registry
+        # The bot that actually served the last stream, which differs from
+        # `bot_name` when a fallback was used.
+        self.served_bot_name: Optional[str] = None
 
     async def stream_content(
         self,
         messages: List[fp.ProtocolMessage],
         **kwargs
     ):
-        MAX_RETRIES = 10
-        while MAX_RETRIES > 0:
+        last_error: Optional[Exception] = None
+        for bot_name in self._breakers.candidates(self._bot_name):
+            breaker = self._breakers.get(bot_name)
+            if not breaker.allow_request():
+                logger.warning(f"Circuit open for bot {bot_name}, skipping")
+                continue
+
+            if bot_name != self._bot_name:
+                logger.warning(f"Falling back from bot {self._bot_name} to {bot_name}")
+
+            has_yielded = False
             try:
-                async for partial in fp.get_bot_response(
-                    messages=messages,
-                    bot_name=self._bot_name,
-                    api_key=self._api_key, 
-                    skip_system_prompt=True,
-                    **kwargs
+                async for text in self._stream_from(bot_name, messages, **kwargs):
+                    has_yielded = True
+                    yield text
+                return
+            except Exception as e:
+                # Text already reached the client; switching bots now would
+                # splice two different answers together. Errors caused by the
+                # request or the key (401, 429, bot refusals) would fail on
+                # any other bot as well.
+                if has_yielded or not is_retryable(e):
+                    raise e
+                last_error = e
+
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError(f"Bot {self._bot_name} is temporarily unavailable, please retry later.")
+
+    async def _stream_from(
+        self,
+        bot_name: str,
+        messages: List[fp.ProtocolMessage],
+        **kwargs
+    ):
+        breaker = self._breakers.get(bot_name)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_counters["attempts"] += 1
+            last_upstream_status.set(None)
+            attempt_started_at = time.monotonic()
+            has_yielded = False
+            # Spans here are never made current: this generator yields.
+            attempt_span = tracing.start_span("poe.attempt")
+            first_partial_span = tracing.start_span("poe.first_partial")
+            if attempt_span is not None:
+                attempt_span.set("bot", bot_name)
+                attempt_span.set("attempt", attempt)
+            try:
+                # fastapi_poe retries on its own by default; RetryPolicy owns
+                # every attempt, so each one is a single upstream request.
+                async for partial in fp.stream_request(
+                    request=_build_query(messages, **kwargs),
+                    bot_name=bot_name,
+                    api_key=self._api_key,
+                    base_url=POE_BOT_BASE_URL,
+                    session=self._session,
+                    num_tries=1
                 ):
                     if isinstance(partial, fp.PartialResponse) and partial.text and not partial.is_replace_response:
+                        if not has_yielded:
+                            has_yielded = True
+                            self.served_bot_name = bot_name
+                            breaker.record_success(time.monotonic() - attempt_started_at)
+                            if first_partial_span is not None:
+                                first_partial_span.end()
                         yield partial.text
 
+                if not has_yielded:
+                    self.served_bot_name = bot_name
+                    breaker.record_success()
+                _record_generation(bot_name, time.monotonic() - attempt_started_at)
                 return
 
+            except (asyncio.CancelledError, GeneratorExit):
+                # The client went away (or every single-flight subscriber
+                # did); leaving the loop closes the upstream response.
+                _record_cancellation(bot_name, time.monotonic() - attempt_started_at)
+                raise
+
             except Exception as e:
-                raise e
+                if attempt_span is not None:
+                    attempt_span.end(error=e)
+                UPSTREAM_ERRORS.labels(model_label(bot_name)).inc()
+                if not has_yielded:
+                    # Only transient upstream failures count against the bot.
+                    if is_retryable(e):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_ignored()
+
+                delay = self._retry_policy.next_delay(
+                    e, attempt, started_at, has_yielded, allow=breaker.allow_request
+                )
+                if delay is None:
+                    logger.warning(
+                        f"Attempt {attempt} for bot {bot_name} failed, not retrying: {e!r}"
+                    )
+                    raise e
+
+                logger.warning(
+                    f"Attempt {attempt} for bot {bot_name} failed, "
+                    f"retrying in {delay:.2f}s: {e!r}"
+                )
+                await asyncio.sleep(delay)
 
             finally:
-                MAX_RETRIES -= 1
\ No newline at end of file
+                if attempt_span is not None:
+                    attempt_span.end()
+
+
+def stream_bot_text(
+    bot_name: str,
+    poe_api_key: str,
+    protocol_messages: List[fp.ProtocolMessage],
+    temperature: Optional[float] = None,
+    session: Optional[httpx.AsyncClient] = None
+) -> AsyncIterator[str]:
+    poe_handler = PoeApiHandler(poe_api_key, bot_name, session=session)
+    return poe_handler.stream_content(messages=protocol_messages, temperature=temperature)
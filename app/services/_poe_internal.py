@@ -4,9 +4,11 @@ from app.models.openai_responses import ResponseStatus, ResponseTypes, Response
 from app.models.openai_responses import Item, OutputItem, Part, ContentPart
 from app.models.openai_responses import ContentText, Error
 from app.models.openai_responses import Usage
-from app.utils.token import count_tokens
+from app.utils.token import count_tokens_many
+from app.utils import tracing
 from app.models.openai_chat_completions import Delta, Choice, ChatCompletion, Message
-from typing import Dict, Any, AsyncGenerator, Optional
+from typing import Dict, Any, AsyncGenerator, Optional, Tuple
+from json.encoder import encode_basestring_ascii
 
 import fastapi_poe as fp
 import time
@@ -21,8 +23,7 @@ def create_completed_error_payload(
 ) -> Response:    
     error_obj = Error(type=type, message=error_message, error_code=error_code)
     return Response(
-        **base_args,
-        store=False,
+        **{**base_args, "store": False},
         created_at=int(time.time()),
         status="failed",
         error=error_obj,
@@ -30,16 +31,17 @@ def create_completed_error_payload(
     )
 
 
-def create_usage(
+async def create_usage(
     input_messages: List[fp.ProtocolMessage],
     output_messages: str
 ) -> Usage:
     
-    input_token_counts = 0
-    output_token_counts = count_tokens(output_messages)
-
-    for msg in input_messages:
-        input_token_counts += count_tokens(msg.content)
+    with tracing.span("usage.tokenize", messages=len(input_messages) + 1):
+        token_counts = await count_tokens_many(
+            [msg.content for msg in input_messages] + [output_messages]
+        )
+    input_token_counts = sum(token_counts[:-1])
+    output_token_counts = token_counts[-1]
     
     return Usage(
         input_tokens=input_token_counts,
@@ -130,7 +132,7 @@ async def sse_finalize(
     )
     yield sse_formatter.format_reponse(ResponseTypes.OUTPUT_ITEM_DONE.value, output_item_done_payload.to_dict())
 
-    usage = create_usage(protocol_messages, accumulated_text)
+    usage = await create_usage(protocol_messages, accumulated_text)
     response_completed_payload = Response(
         **base_response_args.copy(), status=ResponseStatus.COMPLETED.value,
         created_at=int(time.time()), output=[item_base_payload], usage=usage
@@ -145,7 +147,8 @@ def craete_chat_completion(
     base_args: Dict,
     delta: Optional[Delta | Dict[str, Any]] = None,
     message: Optional[Message | Dict[str, Any]] = None,
-    finish_reason: Optional[str] = None
+    finish_reason: Optional[str] = None,
+    created: Optional[int] = None
 ) -> ChatCompletion:
     choice = Choice(
         delta=delta,
@@ -155,6 +158,55 @@ def craete_chat_completion(
     )
     return ChatCompletion(
         **base_args,
-        created=int(time.time()),
+        created=int(time.time()) if created is None else created,
         choices=[choice]
-    )
\ No newline at end of file
+    )
+
+
+class ChatCompletionChunkEncoder:
+    """Byte-level fast path for streamed `chat.completion.chunk` frames.
+
+    The invariant parts of a delta frame are rendered once per stream
+    through the regular models, so the output is byte-identical to
+    `SSEFormatter.format_chat_completion(craete_chat_completion(...).to_dict())`.
+    Each chunk then only escapes its text and splices in the timestamp.
+    """
+
+    _CREATED_SENTINEL = 8_589_934_583
+    _TEXT_SENTINEL = "\x00chunk-text\x00"
+
+    def __init__(self, base_args: Dict[str, Any]):
+        self._first_frame = self._render_template(base_args, role="assistant")
+        self._next_frame = self._render_template(base_args, role=None)
+        self._created = None
+        self._created_bytes = b""
+
+    @classmethod
+    def _render_template(cls, base_args: Dict[str, Any], role: Optional[str]) -> Tuple[bytes, bytes, bytes]:
+        payload = craete_chat_completion(
+            base_args=base_args.copy(),
+            delta=Delta(role=role, content=cls._TEXT_SENTINEL),
+            created=cls._CREATED_SENTINEL
+        )
+        frame = SSEFormatter().format_chat_completion(payload.to_dict()).encode("ascii")
+
+        created_marker = f'"created": {cls._CREATED_SENTINEL}'.encode("ascii")
+        text_marker = encode_basestring_ascii(cls._TEXT_SENTINEL).encode("ascii")
+        if frame.count(created_marker) != 1 or frame.count(text_marker) != 1:
+            raise ValueError("Chat completion chunk template is ambiguous.")
+
+        head, rest = frame.split(created_marker)
+        middle, tail = rest.split(text_marker)
+        return head + b'"created": ', middle, tail
+
+    def encode(self, text: str, is_first_chunk: bool = False) -> bytes:
+        now = int(time.time())
+        if now != self._created:
+            self._created = now
+            self._created_bytes = str(now).encode("ascii")
+
+        head, middle, tail = self._first_frame if is_first_chunk else self._next_frame
+        return b"".join((
+            head, self._created_bytes, middle,
+            encode_basestring_ascii(text).encode("ascii"), tail
+        ))
\ No newline at end of file
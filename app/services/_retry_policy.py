@@ -0,0 +1,134 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+from app.utils.http_client import last_upstream_status
+
+import fastapi_poe as fp
+import httpx
+import httpx_sse
+import logging
+import os
+import random
+import time
+
+
+logger = logging.getLogger(__name__)
+
+retry_counters: Counter = Counter()
+
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 500, 502, 503, 504})
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Classify an upstream failure as transient.
+
+    fastapi_poe wraps transport failures in `BotError`, so the whole cause
+    chain is inspected. Bot-declared `allow_retry: false` errors
+    (`BotErrorNoRetry`) and non-5xx HTTP responses are never retried. A
+    `BotError` without such a cause is retried: it is either an `error`
+    event the bot sent with `allow_retry: true` or a wrapped transient
+    failure.
+    """
+    seen = set()
+    bot_error = False
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+
+        if isinstance(exc, fp.client.BotErrorNoRetry):
+            return False
+        if isinstance(exc, fp.client.BotError):
+            bot_error = True
+        if isinstance(exc, httpx_sse.SSEError):
+            # Upstream answered with a non-SSE body, i.e. an HTTP error.
+            return last_upstream_status.get() in RETRYABLE_STATUS_CODES
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRYABLE_STATUS_CODES
+        if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+            return True
+
+        exc = exc.__cause__ or exc.__context__
+
+    return bot_error
+
+
+class RetryRateLimiter:
+    """Process-wide token bucket that caps how many retries may start per second."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+_global_retry_limiter = RetryRateLimiter(
+    rate=float(os.getenv('POE_RETRY_RATE', '5')),
+    burst=float(os.getenv('POE_RETRY_BURST', '20'))
+)
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = int(os.getenv('POE_RETRY_MAX_ATTEMPTS', '3'))
+    base_delay: float = float(os.getenv('POE_RETRY_BASE_DELAY', '0.25'))
+    max_delay: float = float(os.getenv('POE_RETRY_MAX_DELAY', '4'))
+    budget_seconds: float = float(os.getenv('POE_RETRY_BUDGET_SECONDS', '10'))
+    limiter: RetryRateLimiter = field(default_factory=lambda: _global_retry_limiter)
+
+    def backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter.
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def next_delay(
+        self,
+        exc: BaseException,
+        attempt: int,
+        started_at: float,
+        has_yielded: bool,
+        allow: Optional[Callable[[], bool]] = None
+    ) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up.
+
+        `allow` (the bot's circuit breaker) is consulted last before the
+        rate limiter, so a retry refused by the breaker spends no token.
+        """
+        if has_yielded:
+            retry_counters["gave_up_after_first_chunk"] += 1
+            return None
+        if not is_retryable(exc):
+            retry_counters["non_retryable"] += 1
+            return None
+        if attempt >= self.max_attempts:
+            retry_counters["attempts_exhausted"] += 1
+            return None
+
+        delay = self.backoff(attempt)
+        if time.monotonic() - started_at + delay > self.budget_seconds:
+            retry_counters["budget_exhausted"] += 1
+            return None
+        if allow is not None and not allow():
+            retry_counters["circuit_open"] += 1
+            return None
+        if not self.limiter.try_acquire():
+            retry_counters["rate_limited"] += 1
+            return None
+
+        retry_counters["retries"] += 1
+        return delay
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def retry_stats() -> Dict[str, int]:
+    return dict(retry_counters)
@@ -1,12 +1,12 @@
 from typing import List
 from app.utils import SSEFormatter
 from app.models.openai_chat_completions import Message
-from app.models.openai_chat_completions import Delta
-from typing import Optional
-from ._poe_api_handler import PoeApiHandler
-from ._poe_internal import craete_chat_completion
+from typing import AsyncIterator, Optional
+from ._poe_api_handler import stream_bot_text
+from ._poe_internal import craete_chat_completion, ChatCompletionChunkEncoder
 
 import fastapi_poe as fp
+import httpx
 import uuid
 import logging
 
@@ -18,7 +18,9 @@ async def get_poe_chat_completion_streaming(
         bot_name: str, poe_api_key: str,
         protocol_messages: List[fp.ProtocolMessage],
         request_model_name: str,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        session: Optional[httpx.AsyncClient] = None,
+        text_source: Optional[AsyncIterator[str]] = None
 ):
     response_id = f"chatcmpl-{uuid.uuid4().hex}"
     system_fingerprint = f"fp_{uuid.uuid4().hex[:10]}"
@@ -29,28 +31,15 @@ async def get_poe_chat_completion_streaming(
         "model": request_model_name,
     }
     sse_formatter = SSEFormatter()
+    chunk_encoder = ChatCompletionChunkEncoder(base_response_args)
 
     is_first_chunk = True
     try:
-        poe_handler = PoeApiHandler(poe_api_key, bot_name)
-        async for text_chunk in poe_handler.stream_content(
-            messages=protocol_messages, temperature=temperature
-        ):
-            if is_first_chunk:
-                delta_payload = Delta(
-                    role="assistant",
-                    content=text_chunk
-                )
-                is_first_chunk = False
-            else:
-                delta_payload = Delta(content=text_chunk)
-
-            chat_completion_payload = craete_chat_completion(
-                base_args=base_response_args.copy(),
-                delta=delta_payload,
-            )
-
-            yield sse_formatter.format_chat_completion(chat_completion_payload.to_dict())
+        if text_source is None:
+            text_source = stream_bot_text(bot_name, poe_api_key, protocol_messages, temperature, session)
+        async for text_chunk in text_source:
+            yield chunk_encoder.encode(text_chunk, is_first_chunk)
+            is_first_chunk = False
 
     except Exception as e:
         import traceback
@@ -84,7 +73,9 @@ async def get_poe_chat_completion_non_streaming(
         bot_name: str, poe_api_key: str,
         protocol_messages: List[fp.ProtocolMessage],
         request_model_name: str,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        session: Optional[httpx.AsyncClient] = None,
+        text_source: Optional[AsyncIterator[str]] = None
 ):
     response_id = f"chatcmpl-{uuid.uuid4().hex}"
     system_fingerprint = f"fp_{uuid.uuid4().hex[:10]}"
@@ -97,10 +88,9 @@ async def get_poe_chat_completion_non_streaming(
 
     accumulated_text = ""
     try:
-        poe_handler = PoeApiHandler(poe_api_key, bot_name)
-        async for text_chunk in poe_handler.stream_content(
-            messages=protocol_messages, temperature=temperature
-        ):
+        if text_source is None:
+            text_source = stream_bot_text(bot_name, poe_api_key, protocol_messages, temperature, session)
+        async for text_chunk in text_source:
             accumulated_text += text_chunk
 
     except Exception as e:
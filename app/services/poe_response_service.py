@@ -5,10 +5,11 @@ from app.models.openai_responses import Item, Part
 from app.models.openai_responses import ContentDelta
 from ._poe_internal import create_completed_error_payload, create_usage
 from ._poe_internal import sse_handshake, sse_finalize
-from ._poe_api_handler import PoeApiHandler
-from typing import Optional
+from ._poe_api_handler import stream_bot_text
+from typing import AsyncIterator, Optional
 
 import fastapi_poe as fp
+import httpx
 import uuid
 import time
 import logging
@@ -22,12 +23,18 @@ async def get_poe_response_streaming(
         protocol_messages: List[fp.ProtocolMessage],
         instructions_str: str,
         request_model_name: str,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        session: Optional[httpx.AsyncClient] = None,
+        text_source: Optional[AsyncIterator[str]] = None,
+        response_id: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        store: bool = True
 ):
-    response_id = f"resp-{uuid.uuid4().hex}"
+    response_id = response_id or f"resp-{uuid.uuid4().hex}"
     base_response_args = {
         "id": response_id, "model": request_model_name,
-        "instructions": instructions_str,"temperature": temperature
+        "instructions": instructions_str,"temperature": temperature,
+        "previous_response_id": previous_response_id, "store": store
     }
     sse_formatter = SSEFormatter()
     item_id = f"msg-{uuid.uuid4().hex}"
@@ -37,10 +44,9 @@ async def get_poe_response_streaming(
         async for handshake_event in sse_handshake(sse_formatter, base_response_args, item_id):
             yield handshake_event
 
-        poe_handler = PoeApiHandler(poe_api_key, bot_name)
-        async for text_chunk in poe_handler.stream_content(
-            messages=protocol_messages, temperature=temperature
-        ):
+        if text_source is None:
+            text_source = stream_bot_text(bot_name, poe_api_key, protocol_messages, temperature, session)
+        async for text_chunk in text_source:
             accumulated_text += text_chunk
             delta_data = ContentDelta(
                 type=ResponseTypes.OUTPUT_TEXT_DELTA.value,
@@ -58,7 +64,7 @@ async def get_poe_response_streaming(
     except Exception as e:
         import traceback
 
-        usage = create_usage(protocol_messages, accumulated_text)
+        usage = await create_usage(protocol_messages, accumulated_text)
         tb_str = traceback.format_exc()
 
         logger.error(
@@ -82,21 +88,26 @@ async def get_poe_response_non_streaming(
         protocol_messages: List[fp.ProtocolMessage],
         instructions_str: str,
         request_model_name: str,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        session: Optional[httpx.AsyncClient] = None,
+        text_source: Optional[AsyncIterator[str]] = None,
+        response_id: Optional[str] = None,
+        previous_response_id: Optional[str] = None,
+        store: bool = True
 ):
-    response_id = f"resp-{uuid.uuid4().hex}"
+    response_id = response_id or f"resp-{uuid.uuid4().hex}"
     base_response_args = {
         "id": response_id, "model": request_model_name,
-        "instructions": instructions_str, "temperature": temperature
+        "instructions": instructions_str, "temperature": temperature,
+        "previous_response_id": previous_response_id, "store": store
     }
     item_id = f"msg-{uuid.uuid4().hex}"
     accumulated_text = ""
 
     try:
-        poe_handler = PoeApiHandler(poe_api_key, bot_name)
-        async for text_chunk in poe_handler.stream_content(
-            messages=protocol_messages, temperature=temperature
-        ):
+        if text_source is None:
+            text_source = stream_bot_text(bot_name, poe_api_key, protocol_messages, temperature, session)
+        async for text_chunk in text_source:
             accumulated_text += text_chunk
 
         part_base_payload = Part(type="output_text", text=accumulated_text)
@@ -106,7 +117,7 @@ async def get_poe_response_non_streaming(
             role="assistant",
             content= [part_base_payload]
         )
-        usage = create_usage(protocol_messages, accumulated_text)
+        usage = await create_usage(protocol_messages, accumulated_text)
         response_completed_payload = Response(
             **base_response_args,
             status=ResponseStatus.COMPLETED.value,
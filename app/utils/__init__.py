@@ -1,13 +1,60 @@
 from .message_mapper import to_poe_message
-from .sse_utils import SSEFormatter
-from .token import count_tokens
+from .sse_utils import SSEFormatter, coalesce_sse_frames
+from .token import count_tokens, count_tokens_cached, count_tokens_many
 from .image_manager import ImageManager
+from .http_client import SharedAsyncClient, create_http_client
+from .admission_scheduler import AdmissionScheduler, AdmissionTicket, AdmissionRejected
+from .response_cache import ResponseCache
+from .stream_coalescer import StreamCoalescer, SubscriberOverflow, SharedStreamError
+from .conversation_store import ConversationStore
+from .metrics import instrument_stream, render_metrics, mark_worker_stopped
+from .metrics import RequestSizeMiddleware
+from .tracing import TracingMiddleware, record_validation
+from .request_decoder import decode_client_request
+from .image_budget import ImageMemoryBudget, ImageBudgetExceeded, image_budget
+from .disconnect import ClientDisconnected, CancellableStreamingResponse, cancel_on_disconnect
+from .shared_cache import SharedMemoryCache, open_shared_cache
+from .warmup import warm_up
+from .file_store import FileStore, owner_of
+from .batch_manager import BatchManager
 
 __version__ = "1.1.0"
 
 __all__ = [
     "to_poe_message",
     "SSEFormatter",
+    "coalesce_sse_frames",
     "count_tokens",
-    "ImageManager"
+    "count_tokens_cached",
+    "count_tokens_many",
+    "ImageManager",
+    "SharedAsyncClient",
+    "create_http_client",
+    "AdmissionScheduler",
+    "AdmissionTicket",
+    "AdmissionRejected",
+    "ResponseCache",
+    "StreamCoalescer",
+    "SubscriberOverflow",
+    "SharedStreamError",
+    "ConversationStore",
+    "instrument_stream",
+    "render_metrics",
+    "mark_worker_stopped",
+    "RequestSizeMiddleware",
+    "TracingMiddleware",
+    "record_validation",
+    "decode_client_request",
+    "ImageMemoryBudget",
+    "ImageBudgetExceeded",
+    "image_budget",
+    "ClientDisconnected",
+    "CancellableStreamingResponse",
+    "cancel_on_disconnect",
+    "SharedMemoryCache",
+    "open_shared_cache",
+    "warm_up",
+    "FileStore",
+    "owner_of",
+    "BatchManager"
 ]
\ No newline at end of file
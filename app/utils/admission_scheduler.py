@@ -0,0 +1,243 @@
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple, TypeVar
+from fastapi import HTTPException
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Lane:
+    name: str
+    weight: float
+    deadline: float
+
+
+DEFAULT_LANES: Dict[str, Lane] = {
+    "priority": Lane("priority", weight=4.0, deadline=float(os.getenv('ADMISSION_DEADLINE_PRIORITY', '10'))),
+    "default": Lane("default", weight=2.0, deadline=float(os.getenv('ADMISSION_DEADLINE_DEFAULT', '30'))),
+    "flex": Lane("flex", weight=1.0, deadline=float(os.getenv('ADMISSION_DEADLINE_FLEX', '120'))),
+}
+
+# OpenAI service_tier values that do not name a lane directly.
+_TIER_ALIASES = {"auto": "default", "scale": "priority"}
+
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+
+class AdmissionTicket:
+    """An admitted request's slot. `release()` is idempotent."""
+
+    def __init__(self, scheduler: "AdmissionScheduler", key_id: str, lane: Lane):
+        self._scheduler = scheduler
+        self.key_id = key_id
+        self.lane = lane
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._scheduler._release(self)
+
+    async def hold(self, frames: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Keep the slot for as long as a streaming body is being sent."""
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            self.release()
+            # Close the body chain now rather than when it is collected,
+            # so an abandoned stream releases its upstream promptly.
+            aclose = getattr(frames, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def __del__(self):
+        # Safety net for streaming responses whose body never started.
+        if not self._released:
+            self.release()
+
+
+class _Waiter:
+    __slots__ = ("key_id", "lane", "future")
+
+    def __init__(self, key_id: str, lane: Lane, future: asyncio.Future):
+        self.key_id = key_id
+        self.lane = lane
+        self.future = future
+
+
+class AdmissionScheduler:
+    """Per-key concurrency caps with weighted fair queueing across keys.
+
+    Requests beyond a key's in-flight cap (or the worker-wide cap) wait in
+    a queue ordered by start-time fair queueing: each waiter is tagged
+    with its key's virtual start time plus 1/weight of its service_tier
+    lane, so one busy key cannot starve others and priority traffic
+    overtakes flex traffic. A request whose expected or actual wait
+    exceeds its lane deadline is rejected with 429 and Retry-After.
+    """
+
+    def __init__(
+        self,
+        per_key_limit: Optional[int] = None,
+        global_limit: Optional[int] = None,
+        max_queue_per_key: Optional[int] = None,
+        lanes: Optional[Dict[str, Lane]] = None
+    ):
+        if per_key_limit is None:
+            per_key_limit = int(os.getenv('ADMISSION_PER_KEY_LIMIT', '16'))
+        if global_limit is None:
+            global_limit = int(os.getenv('ADMISSION_GLOBAL_LIMIT', '512'))
+        if max_queue_per_key is None:
+            max_queue_per_key = int(os.getenv('ADMISSION_MAX_QUEUE_PER_KEY', '128'))
+
+        self.per_key_limit = per_key_limit
+        self.global_limit = global_limit
+        self.max_queue_per_key = max_queue_per_key
+        self.lanes = lanes or DEFAULT_LANES
+
+        self._in_flight = 0
+        self._in_flight_by_key: Dict[str, int] = {}
+        self._queued_by_key: Dict[str, int] = {}
+        self._queue: List[Tuple[float, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_tag: Dict[str, float] = {}
+        # EWMA of how long a request holds its slot, for wait estimates.
+        self._avg_hold = 1.0
+        self._rejected = 0
+
+    def resolve_lane(self, service_tier: Optional[str]) -> Lane:
+        tier = _TIER_ALIASES.get(service_tier or "default", service_tier or "default")
+        return self.lanes.get(tier, self.lanes["default"])
+
+    @staticmethod
+    def _key_id(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+    def _has_capacity(self, key_id: str) -> bool:
+        return (
+            self._in_flight < self.global_limit
+            and self._in_flight_by_key.get(key_id, 0) < self.per_key_limit
+        )
+
+    def _next_tag(self, key_id: str, lane: Lane) -> float:
+        tag = max(self._virtual_time, self._last_tag.get(key_id, 0.0)) + 1.0 / lane.weight
+        self._last_tag[key_id] = tag
+        return tag
+
+    def _admit(self, key_id: str, lane: Lane) -> AdmissionTicket:
+        self._in_flight += 1
+        self._in_flight_by_key[key_id] = self._in_flight_by_key.get(key_id, 0) + 1
+        return AdmissionTicket(self, key_id, lane)
+
+    def _estimate_wait(self, key_id: str) -> float:
+        key_backlog = self._queued_by_key.get(key_id, 0) + 1
+        global_backlog = len(self._queue) + 1
+        return self._avg_hold * max(
+            key_backlog / self.per_key_limit,
+            global_backlog / self.global_limit
+        )
+
+    async def acquire(self, api_key: str, service_tier: Optional[str] = None) -> AdmissionTicket:
+        key_id = self._key_id(api_key)
+        lane = self.resolve_lane(service_tier)
+
+        if self._has_capacity(key_id):
+            self._next_tag(key_id, lane)
+            return self._admit(key_id, lane)
+
+        estimated_wait = self._estimate_wait(key_id)
+        if self._queued_by_key.get(key_id, 0) >= self.max_queue_per_key or estimated_wait > lane.deadline:
+            self._rejected += 1
+            logger.warning(f"Rejecting request for key {key_id} in lane {lane.name}: estimated wait {estimated_wait:.1f}s")
+            raise AdmissionRejected("Too many concurrent requests for this API key.", estimated_wait)
+
+        waiter = _Waiter(key_id, lane, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (self._next_tag(key_id, lane), next(self._sequence), waiter))
+        self._queued_by_key[key_id] = self._queued_by_key.get(key_id, 0) + 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout=lane.deadline)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we gave up; hand the slot back.
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                self._remove_waiter(waiter)
+
+            if isinstance(e, asyncio.TimeoutError):
+                self._rejected += 1
+                raise AdmissionRejected("Request queue deadline exceeded.", self._estimate_wait(key_id))
+            raise
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        for i, (_, _, queued) in enumerate(self._queue):
+            if queued is waiter:
+                self._queue[i] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+                self._queued_by_key[waiter.key_id] -= 1
+                return
+
+    def _dispatch(self) -> None:
+        blocked: List[Tuple[float, int, _Waiter]] = []
+        while self._queue and self._in_flight < self.global_limit:
+            entry = heapq.heappop(self._queue)
+            tag, _, waiter = entry
+            if not self._has_capacity(waiter.key_id):
+                blocked.append(entry)
+                continue
+
+            self._queued_by_key[waiter.key_id] -= 1
+            self._virtual_time = max(self._virtual_time, tag)
+            ticket = self._admit(waiter.key_id, waiter.lane)
+            waiter.future.set_result(ticket)
+
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        self._in_flight -= 1
+        remaining = self._in_flight_by_key.get(ticket.key_id, 1) - 1
+        if remaining:
+            self._in_flight_by_key[ticket.key_id] = remaining
+        else:
+            self._in_flight_by_key.pop(ticket.key_id, None)
+            if not self._queued_by_key.get(ticket.key_id):
+                self._queued_by_key.pop(ticket.key_id, None)
+                self._last_tag.pop(ticket.key_id, None)
+
+        self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - ticket.admitted_at)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._queue),
+            "rejected": self._rejected,
+            "keys_in_flight": len(self._in_flight_by_key),
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        }
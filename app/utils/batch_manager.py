@@ -0,0 +1,489 @@
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from pydantic import ValidationError
+from app.models.request_models import ClientRequest
+from app.models.openai_batches import Batch, BatchError, BatchErrors
+from .file_store import FileStore, BATCH_STORAGE_DIR, _write_json, _remove_quietly
+from .metrics import BATCH_REQUESTS
+
+import orjson
+import asyncio
+import contextlib
+import logging
+import json
+import time
+import uuid
+import re
+import os
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINTS = ("/v1/chat/completions", "/v1/responses")
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '64'))
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '50000'))
+# Requests turned away with 429/503 (admission, image budget) are retried.
+BATCH_RETRY_ATTEMPTS = int(os.getenv('BATCH_RETRY_ATTEMPTS', '3'))
+BATCH_PROGRESS_INTERVAL = float(os.getenv('BATCH_PROGRESS_INTERVAL', '1'))
+# Input lines read per trip to a worker thread.
+BATCH_READ_CHUNK_LINES = 256
+
+_BATCH_ID_PATTERN = re.compile(r"batch_[0-9a-f]{32}")
+_TERMINAL_STATUSES = frozenset({"failed", "completed", "expired", "cancelled"})
+_MAX_REPORTED_ERRORS = 100
+
+# Runs one validated request line; returns the response body.
+BatchExecutor = Callable[[str, ClientRequest], Awaitable[Dict[str, Any]]]
+
+
+class _InputFileMissing(Exception):
+    pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_started_at(pid: int) -> Optional[str]:
+    """Kernel start time of `pid`, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces; fields resume after its ')'.
+    return stat.rpartition(")")[2].split()[19]
+
+
+def _runner_alive(record: dict) -> bool:
+    # PIDs are reused (containers restart at 1), so the start time of the
+    # process that ran the batch has to match as well.
+    pid = record["pid"]
+    if not _pid_alive(pid):
+        return False
+    started_at = record.get("started_at")
+    return started_at is None or _process_started_at(pid) == started_at
+
+
+def _error_type(status_code: int) -> str:
+    if status_code == 429:
+        return "rate_limit_exceeded"
+    if status_code >= 500:
+        return "server_error"
+    return "invalid_request_error"
+
+
+class _BatchOutput:
+    """Output and error JSONL files, created on first use.
+
+    `write` only buffers the line; `take` hands the buffered lines over to
+    `write_pending`, which does the file I/O and belongs in a thread.
+    """
+
+    def __init__(self, file_store: FileStore, batch: Batch, owner: str):
+        self.file_store = file_store
+        self.batch = batch
+        self.owner = owner
+        self._files: Dict[str, Any] = {}
+        self._pending: Dict[str, List[bytes]] = {}
+
+    def write(self, kind: str, line: Dict[str, Any]) -> None:
+        self._pending.setdefault(kind, []).append(orjson.dumps(line) + b"\n")
+
+    def take(self) -> Dict[str, List[bytes]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def write_pending(self, pending: Dict[str, List[bytes]]) -> None:
+        for kind, lines in pending.items():
+            f = self._files.get(kind)
+            if f is None:
+                file_object, path = self.file_store.create(f"{self.batch.id}_{kind}.jsonl", f"batch_{kind}", self.owner)
+                setattr(self.batch, f"{kind}_file_id", file_object.id)
+                f = self._files[kind] = open(path, "ab")
+            f.writelines(lines)
+            f.flush()
+
+    def close(self) -> None:
+        self.write_pending(self.take())
+        for f in self._files.values():
+            f.close()
+        for file_id in (self.batch.output_file_id, self.batch.error_file_id):
+            if file_id:
+                self.file_store.finalize(file_id)
+
+
+class BatchManager:
+    """Runs OpenAI-format batch files through the regular request pipeline.
+
+    A batch is validated as a whole first, then its lines are executed by
+    a pool of `concurrency` workers fed from the input file as they go, so
+    memory does not grow with the file. Results are appended to output and
+    error files as they complete, in completion order. State lives in a
+    JSON record per batch, so any worker can answer status polls, and
+    cancellation is a marker file the running worker checks for.
+    """
+
+    def __init__(
+        self,
+        file_store: FileStore,
+        root: str = None,
+        default_concurrency: int = None,
+        max_concurrency: int = None,
+        progress_interval: float = None
+    ):
+        if root is None:
+            root = os.path.join(BATCH_STORAGE_DIR, "batches")
+        if default_concurrency is None:
+            default_concurrency = BATCH_CONCURRENCY
+        if max_concurrency is None:
+            max_concurrency = BATCH_MAX_CONCURRENCY
+        if progress_interval is None:
+            progress_interval = BATCH_PROGRESS_INTERVAL
+
+        self.file_store = file_store
+        self.root = root
+        self.default_concurrency = default_concurrency
+        self.max_concurrency = max_concurrency
+        self.progress_interval = progress_interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _record_path(self, batch_id: str) -> str:
+        return os.path.join(self.root, f"{batch_id}.json")
+
+    def _cancel_marker(self, batch_id: str) -> str:
+        return os.path.join(self.root, f"{batch_id}.cancel")
+
+    def _load(self, batch_id: str) -> Optional[dict]:
+        if not _BATCH_ID_PATTERN.fullmatch(batch_id):
+            return None
+        try:
+            with open(self._record_path(batch_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, batch: Batch, owner: str) -> None:
+        pid = os.getpid()
+        _write_json(self._record_path(batch.id), {
+            "batch": batch.to_dict(), "owner": owner, "pid": pid, "started_at": _process_started_at(pid)
+        })
+
+    def _view(self, record: dict) -> Batch:
+        batch = Batch(**record["batch"])
+        if batch.status not in _TERMINAL_STATUSES and os.path.exists(self._cancel_marker(batch.id)):
+            batch.status = "cancelling"
+            batch.cancelling_at = batch.cancelling_at or int(os.path.getmtime(self._cancel_marker(batch.id)))
+        return batch
+
+    def get(self, batch_id: str, owner: str) -> Optional[Batch]:
+        record = self._load(batch_id)
+        if record is None or record["owner"] != owner:
+            return None
+        return self._view(record)
+
+    def list(self, owner: str, after: Optional[str] = None, limit: int = 20) -> Tuple[List[Batch], bool]:
+        """Blocking; run it in a thread."""
+        records = []
+        for name in os.listdir(self.root):
+            if name.endswith(".json"):
+                record = self._load(name[:-len(".json")])
+                if record is not None and record["owner"] == owner:
+                    records.append(record)
+        batches = sorted((self._view(record) for record in records), key=lambda batch: (-batch.created_at, batch.id))
+
+        if after is not None:
+            ids = [batch.id for batch in batches]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        return batches[:limit], len(batches) > limit
+
+    async def create(
+        self,
+        input_file_id: str,
+        endpoint: str,
+        completion_window: str,
+        metadata: Optional[Dict[str, str]],
+        concurrency: Optional[int],
+        owner: str,
+        execute: BatchExecutor
+    ) -> Batch:
+        if endpoint not in BATCH_ENDPOINTS:
+            raise HTTPException(
+                status_code=400, detail=f"Unsupported endpoint '{endpoint}', expected one of {list(BATCH_ENDPOINTS)}."
+            )
+        if completion_window != "24h":
+            raise HTTPException(status_code=400, detail="Only a completion_window of '24h' is supported.")
+        if concurrency is None:
+            concurrency = self.default_concurrency
+        if not 1 <= concurrency <= self.max_concurrency:
+            raise HTTPException(
+                status_code=400, detail=f"concurrency must be between 1 and {self.max_concurrency}."
+            )
+        input_file = await asyncio.to_thread(self.file_store.get, input_file_id, owner)
+        if input_file is None:
+            raise HTTPException(status_code=404, detail=f"File '{input_file_id}' not found.")
+        if input_file.purpose != "batch":
+            raise HTTPException(status_code=400, detail=f"File '{input_file_id}' was not uploaded with purpose 'batch'.")
+
+        created_at = int(time.time())
+        batch = Batch(
+            id=f"batch_{uuid.uuid4().hex}",
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            completion_window=completion_window,
+            status="validating",
+            created_at=created_at,
+            expires_at=created_at + 24 * 3600,
+            metadata=metadata
+        )
+        await asyncio.to_thread(self._save, batch, owner)
+
+        task = asyncio.ensure_future(self._run(batch, owner, execute, concurrency))
+        self._tasks[batch.id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(batch.id, None))
+        logger.info(f"Created batch {batch.id} for {endpoint} from {input_file_id} with concurrency {concurrency}")
+        return batch
+
+    def cancel(self, batch_id: str, owner: str) -> Optional[Batch]:
+        batch = self.get(batch_id, owner)
+        if batch is None:
+            return None
+        if batch.status in _TERMINAL_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Batch '{batch_id}' is already {batch.status}.")
+
+        # The record belongs to whichever worker runs the batch; it picks
+        # the marker up within `progress_interval`.
+        open(self._cancel_marker(batch_id), "a").close()
+        logger.info(f"Cancellation requested for batch {batch_id}")
+        return self.get(batch_id, owner)
+
+    def recover(self) -> None:
+        """Fail batches whose worker died before finishing them."""
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            record = self._load(name[:-len(".json")])
+            if record is None or record["batch"]["status"] in _TERMINAL_STATUSES or _runner_alive(record):
+                continue
+            batch = Batch(**record["batch"])
+            self._finish(batch, record["owner"], "failed", BatchError(
+                code="batch_interrupted", message="The server restarted before the batch finished."
+            ))
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finish(self, batch: Batch, owner: str, status: str, error: Optional[BatchError] = None) -> None:
+        now = int(time.time())
+        batch.status = status
+        setattr(batch, f"{status}_at", now)
+        if error is not None:
+            batch.errors = BatchErrors(data=[error])
+        self._save(batch, owner)
+        _remove_quietly(self._cancel_marker(batch.id))
+        logger.info(f"Batch {batch.id} {status}: {batch.request_counts.to_dict()}")
+
+    def _read_lines(self, batch: Batch, owner: str) -> Iterator[Tuple[int, bytes]]:
+        path = self.file_store.content_path(batch.input_file_id, owner)
+        if path is None:
+            raise _InputFileMissing()
+        with open(path, "rb") as f:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, line
+
+    def _read_chunks(self, batch: Batch, owner: str) -> Iterator[List[bytes]]:
+        chunk: List[bytes] = []
+        for _, line in self._read_lines(batch, owner):
+            chunk.append(line)
+            if len(chunk) >= BATCH_READ_CHUNK_LINES:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _parse_line(self, batch: Batch, line: bytes) -> Tuple[str, Dict[str, Any]]:
+        try:
+            entry = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            raise ValueError("Line is not valid JSON.")
+        if not isinstance(entry, dict) or not isinstance(entry.get("custom_id"), str):
+            raise ValueError("Line must be a JSON object with a string 'custom_id'.")
+        if entry.get("method", "POST") != "POST":
+            raise ValueError("Only POST requests are supported.")
+        if entry.get("url") != batch.endpoint:
+            raise ValueError(f"Request url must be '{batch.endpoint}', the endpoint of the batch.")
+        if not isinstance(entry.get("body"), dict):
+            raise ValueError("Request 'body' must be a JSON object.")
+        return entry["custom_id"], entry["body"]
+
+    def _validate(self, batch: Batch, owner: str) -> List[BatchError]:
+        errors: List[BatchError] = []
+        custom_ids: Set[str] = set()
+        total = 0
+        for line_number, line in self._read_lines(batch, owner):
+            total += 1
+            try:
+                custom_id, _ = self._parse_line(batch, line)
+                if custom_id in custom_ids:
+                    raise ValueError(f"Duplicate custom_id '{custom_id}'.")
+                custom_ids.add(custom_id)
+            except ValueError as e:
+                errors.append(BatchError(code="invalid_request", message=str(e), line=line_number))
+                if len(errors) >= _MAX_REPORTED_ERRORS:
+                    break
+
+        if total == 0:
+            errors.append(BatchError(code="empty_file", message="The input file has no requests."))
+        elif total > BATCH_MAX_REQUESTS:
+            errors.append(BatchError(
+                code="too_many_requests", message=f"A batch may contain at most {BATCH_MAX_REQUESTS} requests."
+            ))
+        batch.request_counts.total = total
+        return errors
+
+    async def _execute(self, batch: Batch, body: Dict[str, Any], execute: BatchExecutor) -> Tuple[int, Dict[str, Any]]:
+        try:
+            request_data = ClientRequest.model_validate(body).model_copy(update={"stream": False})
+        except ValidationError as e:
+            return 400, {"error": {"message": str(e), "type": "invalid_request_error"}}
+
+        for attempt in range(BATCH_RETRY_ATTEMPTS + 1):
+            try:
+                return 200, await execute(batch.endpoint, request_data)
+            except HTTPException as e:
+                retry_after = (e.headers or {}).get("Retry-After")
+                if e.status_code in (429, 503) and retry_after and attempt < BATCH_RETRY_ATTEMPTS:
+                    await asyncio.sleep(float(retry_after))
+                    continue
+                return e.status_code, {"error": {"message": str(e.detail), "type": _error_type(e.status_code)}}
+            except Exception as e:
+                logger.error(f"Batch {batch.id} request failed: {e!r}")
+                return 500, {"error": {"message": str(e), "type": "server_error"}}
+
+    async def _run(self, batch: Batch, owner: str, execute: BatchExecutor, concurrency: int) -> None:
+        output = _BatchOutput(self.file_store, batch, owner)
+        try:
+            errors = await asyncio.to_thread(self._validate, batch, owner)
+            if errors:
+                batch.errors = BatchErrors(data=errors)
+                await asyncio.to_thread(self._finish, batch, owner, "failed")
+                return
+
+            batch.status = "in_progress"
+            batch.in_progress_at = int(time.time())
+            await asyncio.to_thread(self._save, batch, owner)
+            status = await self._execute_lines(batch, owner, execute, concurrency, output)
+
+            if status == "completed":
+                batch.status = "finalizing"
+                batch.finalizing_at = int(time.time())
+                await asyncio.to_thread(self._save, batch, owner)
+            await asyncio.to_thread(output.close)
+            await asyncio.to_thread(self._finish, batch, owner, status)
+        except asyncio.CancelledError:
+            # Shutting down: write the final record before the loop stops.
+            output.close()
+            self._finish(batch, owner, "failed", BatchError(
+                code="batch_interrupted", message="The server shut down before the batch finished."
+            ))
+            raise
+        except _InputFileMissing:
+            await asyncio.to_thread(output.close)
+            await asyncio.to_thread(self._finish, batch, owner, "failed", BatchError(
+                code="file_not_found", message=f"Input file '{batch.input_file_id}' is gone."
+            ))
+        except Exception as e:
+            logger.error(f"Batch {batch.id} failed: {e!r}")
+            await asyncio.to_thread(output.close)
+            await asyncio.to_thread(self._finish, batch, owner, "failed", BatchError(
+                code="server_error", message=str(e)
+            ))
+
+    async def _execute_lines(
+        self,
+        batch: Batch,
+        owner: str,
+        execute: BatchExecutor,
+        concurrency: int,
+        output: _BatchOutput
+    ) -> str:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+        async def _produce() -> None:
+            chunks = self._read_chunks(batch, owner)
+            try:
+                while chunk := await asyncio.to_thread(next, chunks, None):
+                    for line in chunk:
+                        await queue.put(self._parse_line(batch, line))
+            finally:
+                # A read still running in its thread when cancelled keeps
+                # the generator busy; it is then closed when collected.
+                with contextlib.suppress(ValueError):
+                    await asyncio.to_thread(chunks.close)
+
+        async def _work() -> None:
+            while True:
+                custom_id, body = await queue.get()
+                try:
+                    status_code, response_body = await self._execute(batch, body, execute)
+                    succeeded = status_code == 200
+                    output.write("output" if succeeded else "error", {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": custom_id,
+                        "response": {"status_code": status_code, "request_id": uuid.uuid4().hex, "body": response_body},
+                        "error": None
+                    })
+                    if succeeded:
+                        batch.request_counts.completed += 1
+                    else:
+                        batch.request_counts.failed += 1
+                    BATCH_REQUESTS.labels("completed" if succeeded else "failed").inc()
+                finally:
+                    queue.task_done()
+
+        producer = asyncio.ensure_future(_produce())
+        workers = [asyncio.ensure_future(_work()) for _ in range(concurrency)]
+        drained = asyncio.ensure_future(self._drain(producer, queue))
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {drained, *workers}, timeout=self.progress_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                if drained in done:
+                    drained.result()
+                    return "completed"
+                for worker in done:
+                    worker.result()
+
+                if await asyncio.to_thread(self._checkpoint, batch, owner, output, output.take()):
+                    batch.cancelling_at = int(time.time())
+                    return "cancelled"
+                if time.time() >= batch.expires_at:
+                    return "expired"
+        finally:
+            for task in (producer, drained, *workers):
+                task.cancel()
+            await asyncio.gather(producer, drained, *workers, return_exceptions=True)
+
+    def _checkpoint(self, batch: Batch, owner: str, output: _BatchOutput, pending: Dict[str, List[bytes]]) -> bool:
+        """Persist progress; returns whether the batch was asked to cancel."""
+        output.write_pending(pending)
+        self._save(batch, owner)
+        return os.path.exists(self._cancel_marker(batch.id))
+
+    @staticmethod
+    async def _drain(producer: asyncio.Task, queue: asyncio.Queue) -> None:
+        await producer
+        await queue.join()
@@ -0,0 +1,131 @@
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi_poe.types import Attachment
+from datetime import timedelta
+
+import redis.asyncio as aioredis
+import fastapi_poe as fp
+import logging
+import base64
+import redis
+import json
+import zlib
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """Server-side history for `previous_response_id` follow-ups.
+
+    A stored response keeps the converted protocol messages of its turn,
+    including the assistant reply and attachment references (never image
+    bytes), as zlib-compressed JSON with a TTL. A follow-up only sends its
+    new input and is rehydrated from here. Entries are namespaced by the
+    hashed API key (`owner_of`), so a response id only resolves for the
+    key that created it.
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        cache_ttl: int = None,
+        compression_level: int = 6
+    ):
+        if cache_ttl is None:
+            cache_ttl = int(os.getenv('CONVERSATION_STORE_TTL', '86400'))
+
+        self.redis_client = redis_client
+        self.cache_ttl = cache_ttl
+        self.compression_level = compression_level
+        self.key_prefix = "conversation:"
+
+    def _get_cache_key(self, owner: str, response_id: str) -> str:
+        return f"{self.key_prefix}{owner}:{response_id}"
+
+    @staticmethod
+    def _encode(protocol_messages: List[fp.ProtocolMessage], instructions: str, level: int) -> str:
+        compact = {
+            "instructions": instructions,
+            "messages": [
+                [
+                    message.role,
+                    message.content,
+                    [[attachment.url, attachment.content_type, attachment.name] for attachment in message.attachments or []]
+                ]
+                for message in protocol_messages
+            ],
+        }
+        raw = json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode()
+        # The shared Redis client decodes responses, so store text.
+        return base64.b64encode(zlib.compress(raw, level)).decode("ascii")
+
+    @staticmethod
+    def _decode(cached_data: str) -> Tuple[List[fp.ProtocolMessage], str]:
+        compact = json.loads(zlib.decompress(base64.b64decode(cached_data)))
+        protocol_messages = [
+            fp.ProtocolMessage(
+                role=role,
+                content=content,
+                attachments=[
+                    Attachment(url=url, content_type=content_type, name=name)
+                    for url, content_type, name in attachments
+                ]
+            )
+            for role, content, attachments in compact["messages"]
+        ]
+        return protocol_messages, compact["instructions"]
+
+    async def save(
+        self,
+        owner: str,
+        response_id: str,
+        protocol_messages: List[fp.ProtocolMessage],
+        instructions: str
+    ) -> bool:
+        cached_data = self._encode(protocol_messages, instructions, self.compression_level)
+        try:
+            success = await self.redis_client.setex(
+                self._get_cache_key(owner, response_id),
+                timedelta(seconds=self.cache_ttl),
+                cached_data
+            )
+            if success:
+                logger.info(f"Stored conversation for {response_id} ({len(cached_data)} bytes)")
+            return bool(success)
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Error storing conversation for {response_id}: {e}")
+            return False
+
+    async def load(self, owner: str, response_id: str) -> Optional[Tuple[List[fp.ProtocolMessage], str]]:
+        try:
+            cached_data = await self.redis_client.get(self._get_cache_key(owner, response_id))
+        except redis.exceptions.RedisError as e:
+            logger.error(f"Error loading conversation for {response_id}: {e}")
+            return None
+
+        if not cached_data:
+            return None
+
+        try:
+            return self._decode(cached_data)
+        except (ValueError, KeyError, TypeError, zlib.error) as e:
+            logger.error(f"Corrupt conversation entry for {response_id}: {e}")
+            return None
+
+    async def record(
+        self,
+        owner: str,
+        response_id: str,
+        protocol_messages: List[fp.ProtocolMessage],
+        instructions: str,
+        text_chunks: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """Pass `text_chunks` through and store the finished turn."""
+        chunks: List[str] = []
+        async for text_chunk in text_chunks:
+            chunks.append(text_chunk)
+            yield text_chunk
+
+        history = protocol_messages + [fp.ProtocolMessage(role="bot", content="".join(chunks))]
+        await self.save(owner, response_id, history, instructions)
@@ -0,0 +1,132 @@
+from typing import Any, BinaryIO, Callable, Optional, Tuple, Union
+from io import BytesIO
+
+import binascii
+import hashlib
+import re
+
+
+DataUrl = Union[str, bytes, bytearray, memoryview]
+
+# Data URL headers are short; anything longer than this is not an image header.
+HEADER_SCAN_LIMIT = 256
+# Must be a multiple of 4 so every chunk ends on a base64 quantum boundary.
+DECODE_CHUNK_SIZE = 1 << 18
+
+_HEADER_PATTERN = re.compile(r'data:image/([^;,]+)(?:;[^,]*)?;base64')
+
+
+def _find_payload_start(data_url: DataUrl) -> Tuple[str, int]:
+    prefix = data_url[:HEADER_SCAN_LIMIT]
+    if not isinstance(prefix, str):
+        prefix = bytes(prefix).decode("ascii", errors="replace")
+
+    comma = prefix.find(",")
+    match = _HEADER_PATTERN.fullmatch(prefix, 0, comma) if comma != -1 else None
+    if match is None or comma + 1 >= len(data_url):
+        raise ValueError("Invalid image data url format.")
+
+    return match.group(1), comma + 1
+
+
+def estimate_decoded_size(data_url: DataUrl) -> int:
+    """Upper bound on the decoded size of an image data URL, or 0 if invalid."""
+    try:
+        _, start = _find_payload_start(data_url)
+    except ValueError:
+        return 0
+    return (len(data_url) - start) * 3 // 4
+
+
+def _decode_chunks(
+    source: DataUrl,
+    start: int,
+    write: Callable[[bytes], Any],
+    digest_size: int,
+    chunk_size: int
+) -> Optional[str]:
+    """Decode `source[start:]` chunk by chunk into `write`.
+
+    Returns the hex digest, or None when the payload is not evenly
+    chunkable and has to be decoded whole.
+    """
+    hasher = hashlib.blake2b(digest_size=digest_size)
+    end = len(source)
+
+    try:
+        for offset in range(start, end, chunk_size):
+            chunk = source[offset:offset + chunk_size]
+            decoded = binascii.a2b_base64(chunk)
+
+            # A short non-final chunk means padding or stray characters
+            # shifted the quanta; only a whole-payload decode is exact then.
+            if offset + chunk_size < end and len(decoded) * 4 != len(chunk) * 3:
+                return None
+
+            hasher.update(decoded)
+            write(decoded)
+    except (binascii.Error, ValueError):
+        return None
+
+    return hasher.hexdigest()
+
+
+def decode_image_data_url(
+    data_url: DataUrl,
+    digest_size: int = 16,
+    chunk_size: int = DECODE_CHUNK_SIZE
+) -> Tuple[bytes, str, str]:
+    """Decode a base64 image data URL without materialising extra copies.
+
+    The header is located with a bounded prefix scan, and the payload is
+    decoded from fixed-size slices (zero-copy memoryview slices for bytes
+    input), so besides the input only the decoded bytes stay resident.
+    Returns `(decoded_bytes, image_format, hex_digest)`.
+    """
+    image_format, start = _find_payload_start(data_url)
+    source = data_url if isinstance(data_url, str) else memoryview(data_url)
+
+    if len(source) - start <= chunk_size:
+        return _decode_whole(source[start:], image_format, digest_size)
+
+    buffer = BytesIO()
+    digest = _decode_chunks(source, start, buffer.write, digest_size, chunk_size)
+    if digest is None:
+        return _decode_whole(source[start:], image_format, digest_size)
+
+    return buffer.getvalue(), image_format, digest
+
+
+def decode_image_data_url_to_file(
+    data_url: DataUrl,
+    file: BinaryIO,
+    digest_size: int = 16,
+    chunk_size: int = DECODE_CHUNK_SIZE
+) -> Tuple[int, str, str]:
+    """Like `decode_image_data_url`, but write the decoded bytes to `file`.
+
+    Only one chunk is held in memory at a time. `file` is left positioned
+    at the start. Returns `(decoded_size, image_format, hex_digest)`.
+    """
+    image_format, start = _find_payload_start(data_url)
+    source = data_url if isinstance(data_url, str) else memoryview(data_url)
+
+    digest = _decode_chunks(source, start, file.write, digest_size, chunk_size)
+    if digest is None:
+        file.seek(0)
+        file.truncate()
+        decoded, image_format, digest = _decode_whole(source[start:], image_format, digest_size)
+        file.write(decoded)
+
+    size = file.tell()
+    file.seek(0)
+    return size, image_format, digest
+
+
+def _decode_whole(payload: DataUrl, image_format: str, digest_size: int) -> Tuple[bytes, str, str]:
+    try:
+        decoded = binascii.a2b_base64(payload)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Failed to decode base64 data: {e}")
+
+    return decoded, image_format, hashlib.blake2b(decoded, digest_size=digest_size).hexdigest()
@@ -0,0 +1,106 @@
+from fastapi import HTTPException, Request
+from starlette.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from functools import partial
+from typing import Awaitable, Iterator, TypeVar
+
+import contextlib
+import logging
+import asyncio
+import anyio
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+try:
+    BaseExceptionGroup
+except NameError:  # Python < 3.11; anyio depends on the backport there.
+    from exceptiongroup import BaseExceptionGroup
+
+
+@contextlib.contextmanager
+def collapse_excgroups() -> Iterator[None]:
+    """Re-raise the lone error of an anyio task group as itself."""
+    try:
+        yield
+    except BaseException as exc:
+        while isinstance(exc, BaseExceptionGroup) and len(exc.exceptions) == 1:
+            exc = exc.exceptions[0]
+        raise exc
+
+
+class ClientDisconnected(HTTPException):
+    def __init__(self):
+        # 499 "Client Closed Request"; nobody is left to read it.
+        super().__init__(status_code=499, detail="Client closed the request.")
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Return once the client has gone away.
+
+    Must only be used after the request body has been read, since it
+    consumes ASGI receive messages.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """Await `work`, cancelling it if the client disconnects first.
+
+    Cancellation propagates into the upstream Poe stream, which is closed
+    right away instead of running to completion for nobody.
+    """
+    work_task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work_task.done():
+            work_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await work_task
+
+    if work_task.cancelled():
+        logger.info("Client disconnected, cancelled non-streaming generation")
+        raise ClientDisconnected()
+    return work_task.result()
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """StreamingResponse that always watches for client disconnects.
+
+    Starlette only listens for `http.disconnect` on servers older than
+    ASGI spec 2.4 and otherwise notices a gone client only on the next
+    write, which can be a long time coming while Poe is thinking. It also
+    leaves the body iterator to the garbage collector when cancelled
+    between chunks. Here the iterator is closed as soon as the response
+    ends, so the upstream stream is released promptly.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            with collapse_excgroups():
+                async with anyio.create_task_group() as task_group:
+
+                    async def wrap(func) -> None:
+                        await func()
+                        task_group.cancel_scope.cancel()
+
+                    task_group.start_soon(wrap, partial(self.stream_response, send))
+                    await wrap(partial(self.listen_for_disconnect, receive))
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with anyio.CancelScope(shield=True):
+                    await aclose()
+
+        if self.background is not None:
+            await self.background()
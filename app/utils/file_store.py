@@ -0,0 +1,144 @@
+from typing import BinaryIO, List, Optional, Tuple
+from fastapi import HTTPException
+from app.models.openai_batches import FileObject
+
+import hashlib
+import logging
+import json
+import time
+import uuid
+import re
+import os
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_STORAGE_DIR = os.getenv('BATCH_STORAGE_DIR', 'batch_data')
+FILES_MAX_BYTES = int(os.getenv('FILES_MAX_BYTES', str(200 << 20)))
+
+_FILE_ID_PATTERN = re.compile(r"file-[0-9a-f]{32}")
+
+
+def owner_of(api_key: str) -> str:
+    """Files and batches are scoped to the API key that created them."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:32]
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FileStore:
+    """Uploaded batch inputs and generated batch outputs on local disk.
+
+    Each file is `<id>.jsonl` next to a `<id>.json` metadata record, so
+    every worker of a multi-worker deployment sees the same files.
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        if root is None:
+            root = os.path.join(BATCH_STORAGE_DIR, "files")
+        if max_bytes is None:
+            max_bytes = FILES_MAX_BYTES
+
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, file_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, file_id)
+        return f"{base}.jsonl", f"{base}.json"
+
+    def _load(self, file_id: str) -> Optional[dict]:
+        if not _FILE_ID_PATTERN.fullmatch(file_id):
+            return None
+        try:
+            with open(self._paths(file_id)[1]) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_upload(self, source: BinaryIO, filename: str, purpose: str, owner: str) -> FileObject:
+        """Copy an upload into the store. Blocking; run it in a thread."""
+        file_id = f"file-{uuid.uuid4().hex}"
+        content_path, meta_path = self._paths(file_id)
+        size = 0
+        try:
+            with open(content_path, "wb") as f:
+                while chunk := source.read(1 << 20):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File is larger than the {self.max_bytes} byte limit."
+                        )
+                    f.write(chunk)
+        except BaseException:
+            _remove_quietly(content_path)
+            raise
+
+        file_object = FileObject(
+            id=file_id, bytes=size, created_at=int(time.time()), filename=filename, purpose=purpose
+        )
+        _write_json(meta_path, {"file": file_object.to_dict(), "owner": owner})
+        logger.info(f"Stored file {file_id} ({size} bytes) for purpose {purpose}")
+        return file_object
+
+    def create(self, filename: str, purpose: str, owner: str) -> Tuple[FileObject, str]:
+        """Register an empty file to be written by the caller; see `finalize`."""
+        file_id = f"file-{uuid.uuid4().hex}"
+        content_path, meta_path = self._paths(file_id)
+        open(content_path, "wb").close()
+        file_object = FileObject(
+            id=file_id, bytes=0, created_at=int(time.time()), filename=filename, purpose=purpose
+        )
+        _write_json(meta_path, {"file": file_object.to_dict(), "owner": owner})
+        return file_object, content_path
+
+    def finalize(self, file_id: str) -> None:
+        record = self._load(file_id)
+        if record is None:
+            return
+        content_path, meta_path = self._paths(file_id)
+        record["file"]["bytes"] = os.path.getsize(content_path)
+        _write_json(meta_path, record)
+
+    def get(self, file_id: str, owner: str) -> Optional[FileObject]:
+        record = self._load(file_id)
+        if record is None or record["owner"] != owner:
+            return None
+        return FileObject(**record["file"])
+
+    def content_path(self, file_id: str, owner: str) -> Optional[str]:
+        if self.get(file_id, owner) is None:
+            return None
+        return self._paths(file_id)[0]
+
+    def list(self, owner: str, purpose: Optional[str] = None) -> List[FileObject]:
+        """Blocking; run it in a thread."""
+        files = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            file_object = self.get(name[:-len(".json")], owner)
+            if file_object is not None and (purpose is None or file_object.purpose == purpose):
+                files.append(file_object)
+        return sorted(files, key=lambda file_object: file_object.created_at, reverse=True)
+
+    def delete(self, file_id: str, owner: str) -> bool:
+        if self.get(file_id, owner) is None:
+            return False
+        for path in self._paths(file_id):
+            _remove_quietly(path)
+        logger.info(f"Deleted file {file_id}")
+        return True
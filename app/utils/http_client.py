@@ -0,0 +1,65 @@
+from typing import Optional
+from contextvars import ContextVar
+
+from .tracing import inject_trace_context
+
+import httpx
+import os
+
+
+# Overridable so the proxy can be pointed at a local fake Poe for load tests.
+POE_BOT_BASE_URL = os.getenv('POE_BOT_BASE_URL', 'https://api.poe.com/bot/')
+POE_UPLOAD_BASE_URL = os.getenv('POE_UPLOAD_BASE_URL', 'https://www.quora.com/poe_api/')
+
+# Status of the most recent upstream response seen by the current task.
+# fastapi_poe reports a non-SSE error response only as a content-type
+# mismatch, so the retry policy reads the status from here instead.
+last_upstream_status: ContextVar[Optional[int]] = ContextVar("last_upstream_status", default=None)
+
+
+async def _record_upstream_status(response: httpx.Response) -> None:
+    last_upstream_status.set(response.status_code)
+
+
+class SharedAsyncClient(httpx.AsyncClient):
+    """Long-lived AsyncClient that survives being used as a context manager.
+
+    `fastapi_poe.upload_file` wraps whatever session it receives in
+    `async with`, which would close (or refuse to reopen) a shared client.
+    This subclass turns enter/exit into no-ops; the owner closes it with
+    `aclose()` on shutdown.
+    """
+
+    async def __aenter__(self) -> "SharedAsyncClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+
+def create_http_client(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+    timeout: Optional[float] = None
+) -> SharedAsyncClient:
+    if max_connections is None:
+        max_connections = int(os.getenv('POE_HTTP_MAX_CONNECTIONS', '200'))
+    if max_keepalive_connections is None:
+        max_keepalive_connections = int(os.getenv('POE_HTTP_MAX_KEEPALIVE', '50'))
+    if keepalive_expiry is None:
+        keepalive_expiry = float(os.getenv('POE_HTTP_KEEPALIVE_EXPIRY', '60'))
+    if timeout is None:
+        # Same as fastapi_poe's own default for bot queries.
+        timeout = float(os.getenv('POE_HTTP_TIMEOUT', '600'))
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+    return SharedAsyncClient(
+        limits=limits,
+        timeout=timeout,
+        event_hooks={"request": [inject_trace_context], "response": [_record_upstream_status]}
+    )
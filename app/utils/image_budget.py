@@ -0,0 +1,117 @@
+from fastapi import HTTPException
+from typing import Dict, Optional
+from .metrics import IMAGE_MEMORY_RESERVED, IMAGE_BUDGET_REJECTIONS, IMAGE_SPILLS
+
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageBudgetExceeded(HTTPException):
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)} if retry_after else None
+        )
+
+
+class ImageReservation:
+    """Bytes reserved for one request's images. `release()` is idempotent."""
+
+    def __init__(self, budget: "ImageMemoryBudget", resident_bytes: int):
+        self._budget = budget
+        self.resident_bytes = resident_bytes
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._budget._release(self.resident_bytes)
+
+    def __enter__(self) -> "ImageReservation":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class ImageMemoryBudget:
+    """Per-request and per-worker limits on decoded image bytes.
+
+    Images larger than `spill_threshold` are decoded to a temporary file
+    and streamed to Poe from there, so they only count against the
+    per-request limit. Smaller ones are decoded in memory and reserve
+    their size from the worker budget until the request's uploads finish.
+    A request over its own limit gets 413; one that does not fit in what
+    is left of the worker budget gets 503 with Retry-After.
+    """
+
+    def __init__(
+        self,
+        worker_bytes: int = None,
+        request_bytes: int = None,
+        spill_threshold: int = None,
+        spill_dir: Optional[str] = None
+    ):
+        if worker_bytes is None:
+            worker_bytes = int(os.getenv('IMAGE_MEMORY_BUDGET_BYTES', str(256 << 20)))
+        if request_bytes is None:
+            request_bytes = int(os.getenv('IMAGE_REQUEST_BUDGET_BYTES', str(64 << 20)))
+        if spill_threshold is None:
+            spill_threshold = int(os.getenv('IMAGE_SPILL_THRESHOLD_BYTES', str(8 << 20)))
+        if spill_dir is None:
+            spill_dir = os.getenv('IMAGE_SPILL_DIR') or None
+
+        self.worker_bytes = worker_bytes
+        self.request_bytes = request_bytes
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.reserved_bytes = 0
+        self._stats = {"admitted": 0, "rejected_request": 0, "rejected_worker": 0, "spilled": 0}
+
+    def should_spill(self, decoded_size: int) -> bool:
+        return decoded_size > self.spill_threshold
+
+    def reserve(self, decoded_sizes: Dict[str, int]) -> ImageReservation:
+        """Admit a request's images, keyed by identity, before decoding any."""
+        total_bytes = sum(decoded_sizes.values())
+        if total_bytes > self.request_bytes:
+            self._stats["rejected_request"] += 1
+            IMAGE_BUDGET_REJECTIONS.labels("request").inc()
+            raise ImageBudgetExceeded(
+                413,
+                f"Images in this request decode to {total_bytes} bytes, "
+                f"more than the {self.request_bytes} byte limit."
+            )
+
+        resident_bytes = sum(size for size in decoded_sizes.values() if not self.should_spill(size))
+        if resident_bytes and self.reserved_bytes + resident_bytes > self.worker_bytes:
+            self._stats["rejected_worker"] += 1
+            IMAGE_BUDGET_REJECTIONS.labels("worker").inc()
+            logger.warning(
+                f"Image memory budget exhausted: {self.reserved_bytes} reserved, "
+                f"{resident_bytes} requested, {self.worker_bytes} available."
+            )
+            raise ImageBudgetExceeded(503, "Server is busy processing images, retry later.", retry_after=1)
+
+        spilled = sum(1 for size in decoded_sizes.values() if self.should_spill(size))
+        self.reserved_bytes += resident_bytes
+        self._stats["admitted"] += 1
+        self._stats["spilled"] += spilled
+        IMAGE_SPILLS.inc(spilled)
+        IMAGE_MEMORY_RESERVED.inc(resident_bytes)
+        return ImageReservation(self, resident_bytes)
+
+    def _release(self, resident_bytes: int) -> None:
+        self.reserved_bytes -= resident_bytes
+        IMAGE_MEMORY_RESERVED.dec(resident_bytes)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "reserved_bytes": self.reserved_bytes}
+
+
+image_budget = ImageMemoryBudget()
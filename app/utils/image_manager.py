@@ -1,7 +1,12 @@
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Optional
 from fastapi_poe.types import Attachment
 from datetime import timedelta
+from .lru_cache import LRUCache
+from .shared_cache import SharedMemoryCache, open_shared_cache
+from .metrics import ATTACHMENT_CACHE_LOOKUPS
 
+import redis.asyncio as aioredis
+import asyncio
 import redis
 import os
 import logging
@@ -10,74 +15,207 @@ import json
 logger = logging.getLogger(__name__)
 
 
+# Room for an attachment URL, content type and file name as JSON.
+SHARED_ATTACHMENT_VALUE_SIZE = int(os.getenv('SHARED_CACHE_ATTACHMENT_BYTES', '1024'))
+
+
 class RedisConnectionError(Exception):
     pass
 
 
+def _encode_attachment(attachment: Attachment) -> bytes:
+    return json.dumps(attachment.model_dump()).encode()
+
+
+def _decode_attachment(data: bytes) -> Attachment:
+    return Attachment(**json.loads(data))
+
+
 class ImageManager:
-    def __init__(self, redis_url: str = None, cache_ttl: int = 600):
+    def __init__(
+        self,
+        redis_url: str = None,
+        cache_ttl: int = 600,
+        memory_cache_size: int = None,
+        memory_cache_ttl: int = None,
+        max_connections: int = None,
+        shared_cache_slots: int = None
+    ):
         if redis_url is None:
             redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
+        if memory_cache_size is None:
+            memory_cache_size = int(os.getenv('IMAGE_CACHE_MEMORY_SIZE', '1024'))
+        if memory_cache_ttl is None:
+            memory_cache_ttl = int(os.getenv('IMAGE_CACHE_MEMORY_TTL', str(cache_ttl)))
+        if max_connections is None:
+            max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', '64'))
+        if shared_cache_slots is None:
+            shared_cache_slots = int(os.getenv('SHARED_CACHE_ATTACHMENT_SLOTS', '16384'))
 
+        self.redis_url = redis_url
+        self.connection_pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            decode_responses=True,
+            max_connections=max_connections
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.connection_pool)
+
+        self.cache_ttl = cache_ttl
+        self.key_prefix = "image_attachment:"
+        # In multi-worker mode the memory tier is shared by all workers.
+        self.memory_cache = open_shared_cache(
+            "attachments",
+            slots=shared_cache_slots,
+            value_size=SHARED_ATTACHMENT_VALUE_SIZE,
+            encode=_encode_attachment,
+            decode=_decode_attachment,
+            ttl=min(memory_cache_ttl, cache_ttl)
+        )
+        if self.memory_cache is None:
+            self.memory_cache = LRUCache(
+                maxsize=memory_cache_size,
+                ttl=min(memory_cache_ttl, cache_ttl)
+            )
+        self._stats: Dict[str, Dict[str, int]] = {
+            "memory": {"hits": 0, "misses": 0},
+            "redis": {"hits": 0, "misses": 0, "errors": 0},
+            "inflight": {"hits": 0},
+        }
+        # Mirrored into a Prometheus counter so that every worker's
+        # lookups add up under multi-process metrics.
+        self._lookup_counters = {
+            (tier, result): ATTACHMENT_CACHE_LOOKUPS.labels(tier, result)
+            for tier, counters in self._stats.items() for result in counters
+        }
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def connect(self) -> None:
         try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
-            self.redis_client.ping()
+            await self.redis_client.ping()
         except redis.exceptions.ConnectionError as e:
-            logger.error(f"Failed to connect to Redis at {redis_url}: {e}")
+            logger.error(f"Failed to connect to Redis at {self.redis_url}: {e}")
             raise RedisConnectionError(f"Redis connection failed: {e}") from e
-        
-        self.cache_ttl = cache_ttl
-        self.key_prefix = "image_attachment:"
 
-    def _get_cache_key(self, image_url: str) -> str:
-        return f"{self.key_prefix}{image_url}"
-    
-    def get_attachment(self, image_url: str) -> Optional[Attachment]:
+    async def close(self) -> None:
+        if isinstance(self.memory_cache, SharedMemoryCache):
+            self.memory_cache.close()
+        await self.redis_client.aclose()
+        await self.connection_pool.disconnect()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {tier: counters.copy() for tier, counters in self._stats.items()}
+
+    def _count(self, tier: str, result: str) -> None:
+        self._stats[tier][result] += 1
+        self._lookup_counters[tier, result].inc()
+
+    def _get_cache_key(self, image_digest: str) -> str:
+        return f"{self.key_prefix}{image_digest}"
+
+    async def get_attachment(self, image_digest: str) -> Optional[Attachment]:
+        cache_key = self._get_cache_key(image_digest)
+
+        attachment = self.memory_cache.get(cache_key)
+        if attachment is not None:
+            self._count("memory", "hits")
+            logger.info(f"Memory cache hit for image: {image_digest[:12]}")
+            return attachment
+        self._count("memory", "misses")
+
         try:
-            cache_key = self._get_cache_key(image_url)
-            cached_data = self.redis_client.get(cache_key)
+            cached_data = await self.redis_client.get(cache_key)
 
             if cached_data:
-                logger.info(f"Cache hit for image: {image_url[-4:]}")
-                attachment_dict = json.loads(cached_data)
-                return Attachment(**attachment_dict)
+                self._count("redis", "hits")
+                logger.info(f"Cache hit for image: {image_digest[:12]}")
+                attachment = Attachment(**json.loads(cached_data))
+                self.memory_cache.set(cache_key, attachment)
+                return attachment
             else:
-                logger.info(f"Cache miss for image: {image_url[-4:]}")
+                self._count("redis", "misses")
+                logger.info(f"Cache miss for image: {image_digest[:12]}")
                 return None
         except (redis.exceptions.RedisError, json.JSONDecodeError) as e:
-            logger.error(f"Error retrieving attachment from cache for {image_url[-4:]}: {e}")
+            self._count("redis", "errors")
+            logger.error(f"Error retrieving attachment from cache for {image_digest[:12]}: {e}")
             return None
-        
-    def set_attachment(self, image_url: str, attachment: Attachment) -> bool:
+
+    async def set_attachment(self, image_digest: str, attachment: Attachment) -> bool:
+        cache_key = self._get_cache_key(image_digest)
+        self.memory_cache.set(cache_key, attachment)
+
         try:
-            cache_key = self._get_cache_key(image_url)
             attachment_dict = attachment.model_dump()
             cached_data = json.dumps(attachment_dict)
 
-            success = self.redis_client.setex(
-                cache_key, 
-                timedelta(seconds=self.cache_ttl), 
+            success = await self.redis_client.setex(
+                cache_key,
+                timedelta(seconds=self.cache_ttl),
                 cached_data
             )
 
             if success:
-                logger.info(f"Cached attachment for image: {image_url[-4:]}")
+                logger.info(f"Cached attachment for image: {image_digest[:12]}")
             else:
-                logger.warning(f"Failed to cache attachment for image: {image_url[-4:]}")
-                
+                logger.warning(f"Failed to cache attachment for image: {image_digest[:12]}")
+
             return bool(success)
 
-        except (redis.exceptions.RedisError, json.JSONEncodeError) as e:
-            logger.error(f"Error caching attachment for {image_url[-4:]}: {e}")
+        except (redis.exceptions.RedisError, TypeError, ValueError) as e:
+            self._count("redis", "errors")
+            logger.error(f"Error caching attachment for {image_digest[:12]}: {e}")
             return False
-        
-    def clear_all_cache(self):
+
+    async def get_or_create_attachment(
+        self,
+        image_digest: str,
+        create: Callable[[], Awaitable[Attachment]]
+    ) -> Attachment:
+        """Return the cached attachment for `image_digest`, or create it once.
+
+        Concurrent callers asking for the same digest share a single
+        in-flight `create()` call instead of each uploading the same bytes.
+        The shared task is shielded, so one caller going away does not
+        cancel the upload for the others.
+        """
+        inflight = self._inflight.get(image_digest)
+        if inflight is None:
+            cached_attachment = await self.get_attachment(image_digest)
+            if cached_attachment:
+                return cached_attachment
+            inflight = self._inflight.get(image_digest)
+
+        if inflight is not None:
+            self._count("inflight", "hits")
+            logger.info(f"Joining in-flight upload for image: {image_digest[:12]}")
+            return await asyncio.shield(inflight)
+
+        async def _create_and_cache() -> Attachment:
+            attachment = await create()
+            if attachment:
+                await self.set_attachment(image_digest, attachment)
+            return attachment
+
+        task = asyncio.ensure_future(_create_and_cache())
+        self._inflight[image_digest] = task
+        task.add_done_callback(lambda t: self._release_inflight(image_digest, t))
+        return await asyncio.shield(task)
+
+    def _release_inflight(self, image_digest: str, task: asyncio.Task) -> None:
+        if self._inflight.get(image_digest) is task:
+            del self._inflight[image_digest]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away.
+            task.exception()
+
+    async def clear_all_cache(self):
+        self.memory_cache.clear()
         try:
             pattern = f"{self.key_prefix}*"
-            keys = self.redis_client.keys(pattern)
+            keys = await self.redis_client.keys(pattern)
             if keys:
-                deleted_count = self.redis_client.delete(*keys)
+                deleted_count = await self.redis_client.delete(*keys)
                 logger.info(f"Cleared {deleted_count} image caches")
         except redis.exceptions.RedisError as e:
             logger.error(f"Error clearing all cache: {e}")
-            raise e
\ No newline at end of file
+            raise e
@@ -1,21 +1,32 @@
-from typing import List, Tuple, Optional, BinaryIO
+from typing import Dict, List, Tuple, Optional, BinaryIO
 from fastapi import HTTPException
 from app.models.request_models import ClientInput
 from io import BytesIO
 from fastapi_poe.types import Attachment
+from fastapi_poe.client import AttachmentUploadError
 from .image_manager import ImageManager
+from .image_budget import ImageMemoryBudget, image_budget
+from .data_url import DataUrl, decode_image_data_url, decode_image_data_url_to_file, estimate_decoded_size
+from .metrics import UPLOAD_LATENCY
+from .http_client import POE_UPLOAD_BASE_URL
+from . import tracing
 
+import httpx
 import logging
 import fastapi_poe as fp
-import re
-import base64
 import time
 import string
 import random
+import asyncio
+import tempfile
+import os
 
 
 logger = logging.getLogger(__name__)
 
+IMAGE_DIGEST_SIZE = 16
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv('IMAGE_UPLOAD_CONCURRENCY', '4'))
+
 
 def _convert_role_to_poe(role: str) -> str:
     role_mapping = {
@@ -32,21 +43,26 @@ def _convert_role_to_poe(role: str) -> str:
     return "user"
 
 
-def _parse_image_url(image_url: str) -> Tuple[BinaryIO, str]:
-    pattern = r'^data:image/([^;,]+)(?:;[^,]*)?;base64,(.+)$'
-    match = re.match(pattern, image_url)
+def _parse_image_url(image_url: DataUrl) -> Tuple[BinaryIO, str, str]:
+    with tracing.span("image.decode", encoded_bytes=len(image_url)):
+        decoded_data, image_format, image_digest = decode_image_data_url(
+            image_url, digest_size=IMAGE_DIGEST_SIZE
+        )
+    return BytesIO(decoded_data), image_format, image_digest
 
-    if not match:
-        raise ValueError("Invalid image data url format.")
-    
-    image_format = match.group(1)
-    base64_data = match.group(2)
 
+def _spill_image_url(image_url: DataUrl, spill_dir: Optional[str] = None) -> Tuple[BinaryIO, str, str]:
+    """Decode into an anonymous temporary file instead of memory."""
+    spill_file = tempfile.TemporaryFile(dir=spill_dir)
     try:
-        decoded_data = base64.b64decode(base64_data)
-        return BytesIO(decoded_data), image_format
-    except Exception as e:
-        raise ValueError(f"Failed to decode base64 data: {e}")
+        with tracing.span("image.decode", encoded_bytes=len(image_url), spilled=True):
+            _, image_format, image_digest = decode_image_data_url_to_file(
+                image_url, spill_file, digest_size=IMAGE_DIGEST_SIZE
+            )
+    except BaseException:
+        spill_file.close()
+        raise
+    return spill_file, image_format, image_digest
 
 
 def _normalize_image_format(image_format: str) -> str:
@@ -71,70 +87,165 @@ def _generate_image_filename(
     return f"{prefix}_{timestamp}_{random_str}.{extension}"
 
 
+async def _post_file(
+    session: httpx.AsyncClient,
+    file: BinaryIO,
+    file_name: str,
+    api_key: str
+) -> Attachment:
+    file.seek(0)
+    response = await session.post(
+        POE_UPLOAD_BASE_URL.rstrip("/") + "/file_upload_3RD_PARTY_POST",
+        files={"file": (file_name, file)},
+        headers={"Authorization": api_key}
+    )
+    if response.status_code != 200:
+        raise AttachmentUploadError(f"{response.status_code} {response.reason_phrase}: {response.text}")
+
+    data = response.json()
+    if not {"attachment_url", "mime_type"}.issubset(data):
+        raise AttachmentUploadError(f"Unexpected response format: {data}")
+
+    return Attachment(url=data["attachment_url"], content_type=data["mime_type"], name=file_name)
+
+
+async def _upload_file(
+    file: BinaryIO,
+    file_name: str,
+    api_key: str,
+    http_client: Optional[httpx.AsyncClient] = None,
+    num_tries: int = 2,
+    retry_sleep_time: float = 0.5
+) -> Attachment:
+    """Upload an image the way `fp.upload_file` does, for every image.
+
+    `fp.upload_file` reads the whole file into memory before building the
+    multipart body, does not rewind it between tries and closes the
+    session it is given. Here httpx streams the file object (from disk
+    for spilled images) and every try starts from the beginning.
+    """
+    session = http_client or httpx.AsyncClient(timeout=120)
+    try:
+        for attempt in range(1, num_tries):
+            try:
+                return await _post_file(session, file, file_name, api_key)
+            except Exception as e:
+                logger.warning(f"Upload attempt {attempt}/{num_tries} of {file_name} failed: {e}")
+                await asyncio.sleep(retry_sleep_time)
+        return await _post_file(session, file, file_name, api_key)
+    finally:
+        if http_client is None:
+            await session.aclose()
+
+
 async def _convert_image_to_attachment(
     img_data: BinaryIO,
     img_format: str,
-    api_key: str
+    api_key: str,
+    http_client: Optional[httpx.AsyncClient] = None
 ) -> Attachment:
     file_name = _generate_image_filename(img_format)
-    attachment = await fp.upload_file(
-        file=img_data,
-        file_name=file_name,
-        api_key=api_key
-    )
+    started_at = time.perf_counter()
+    with tracing.span("image.upload", file_name=file_name):
+        attachment = await _upload_file(img_data, file_name, api_key, http_client)
+    UPLOAD_LATENCY.observe(time.perf_counter() - started_at)
     logger.info(f"Image {file_name} has been uploaed.")
 
     return attachment
 
 
-async def _process_single_image(image_url: str, api_key: str, image_manager: ImageManager) -> Attachment:
-    cached_attachment = image_manager.get_attachment(image_url)
-    if cached_attachment:
-        logger.info(f"Using cached attachment for image: {image_url[-4:]}")
-        return cached_attachment
-
-    logger.info(f"Processing image from source: {image_url[-4:]}")
-    img_data, img_format = _parse_image_url(image_url)
-    attachment = await _convert_image_to_attachment(img_data, img_format, api_key)
-    if attachment:
-        image_manager.set_attachment(image_url, attachment)
-
+async def _process_single_image(
+    image_url: DataUrl,
+    api_key: str,
+    image_manager: ImageManager,
+    http_client: Optional[httpx.AsyncClient] = None,
+    budget: ImageMemoryBudget = image_budget
+) -> Attachment:
+    if budget.should_spill(estimate_decoded_size(image_url)):
+        img_data, img_format, img_digest = _spill_image_url(image_url, budget.spill_dir)
+    else:
+        img_data, img_format, img_digest = _parse_image_url(image_url)
+    uploading = False
+
+    async def _upload() -> Attachment:
+        nonlocal uploading
+        uploading = True
+        logger.info(f"Processing image from source: {img_digest[:12]}")
+        try:
+            return await _convert_image_to_attachment(img_data, img_format, api_key, http_client)
+        finally:
+            img_data.close()
+
+    attachment = await image_manager.get_or_create_attachment(img_digest, _upload)
+    # Cache hit or joined upload. If this call is cancelled instead, the
+    # shielded upload may still need the data; it is freed with `_upload`.
+    if not uploading:
+        img_data.close()
     return attachment
 
 
-def _attach_image_to_last_user_message(
-    protocol_messages: List[fp.ProtocolMessage], 
-    attachment: Attachment
-) -> None:
+def _last_user_message_index(protocol_messages: List[fp.ProtocolMessage]) -> int:
     for i in range(len(protocol_messages) - 1, -1, -1):
         if protocol_messages[i].role == "user":
-            current_attachments = getattr(protocol_messages[i], 'attachments', None) or []
-            protocol_messages[i].attachments = current_attachments + [attachment]
-            return
-
-    new_user_message = fp.ProtocolMessage(
-        role="user",
-        content="",
-        attachments=[attachment]
-    )
-    
-    protocol_messages.append(new_user_message)
+            return i
+
+    protocol_messages.append(fp.ProtocolMessage(role="user", content=""))
+    return len(protocol_messages) - 1
+
+
+async def _attach_images(
+        protocol_messages: List[fp.ProtocolMessage],
+        image_slots: List[Tuple[int, DataUrl]],
+        api_key: str,
+        image_manager: ImageManager,
+        http_client: Optional[httpx.AsyncClient],
+        upload_concurrency: Optional[int],
+        budget: ImageMemoryBudget
+) -> None:
+    semaphore = asyncio.Semaphore(upload_concurrency or IMAGE_UPLOAD_CONCURRENCY)
+    # Identical images within the request resolve to a single coroutine.
+    pending: Dict[DataUrl, asyncio.Task] = {}
+
+    async def _bounded(image_url: DataUrl) -> Attachment:
+        async with semaphore:
+            return await _process_single_image(image_url, api_key, image_manager, http_client, budget)
+
+    for _, image_url in image_slots:
+        if image_url not in pending:
+            pending[image_url] = asyncio.ensure_future(_bounded(image_url))
+
+    try:
+        await asyncio.gather(*pending.values())
+    except BaseException:
+        for task in pending.values():
+            task.cancel()
+        raise
+
+    for message_index, image_url in image_slots:
+        target = protocol_messages[message_index]
+        target.attachments = (target.attachments or []) + [pending[image_url].result()]
 
 
 async def to_poe_message(
         source_messages: List[ClientInput],
         api_key: str,
-        image_manager: ImageManager
+        image_manager: ImageManager,
+        http_client: Optional[httpx.AsyncClient] = None,
+        upload_concurrency: Optional[int] = None,
+        budget: ImageMemoryBudget = image_budget
 ) -> Tuple[List[fp.ProtocolMessage], Optional[str]]:
 
     protocol_messages: List[fp.ProtocolMessage] = []
     instructions_str = "You are a helpful assistant."
 
+    # (target message index, image url) in request order; images are
+    # uploaded concurrently but attached in this order afterwards.
+    image_slots: List[Tuple[int, DataUrl]] = []
+
     for msg in source_messages:
         for content in msg.content:
             if content.type == "input_image":
-                attachment = await _process_single_image(content.image_url, api_key, image_manager)
-                _attach_image_to_last_user_message(protocol_messages, attachment)
+                image_slots.append((_last_user_message_index(protocol_messages), content.image_url))
                 continue
 
             if msg.role == "system":
@@ -150,4 +261,10 @@ async def to_poe_message(
         raise HTTPException(
             status_code=400, detail="Messages list (derived from 'input') cannot be empty.")
 
-    return protocol_messages, instructions_str
\ No newline at end of file
+    if image_slots:
+        # Rejects with 413/503 before anything is decoded.
+        with budget.reserve({image_url: estimate_decoded_size(image_url) for _, image_url in image_slots}):
+            await _attach_images(protocol_messages, image_slots, api_key, image_manager,
+                                 http_client, upload_concurrency, budget)
+
+    return protocol_messages, instructions_str
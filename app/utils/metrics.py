@@ -0,0 +1,192 @@
+from typing import AsyncIterator, Iterable, List, Set, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from .token import count_tokens_many
+
+import asyncio
+import logging
+import time
+import os
+
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTED_ENDPOINTS = ("/v1/responses", "/v1/chat/completions")
+# Set by app.serve: every worker writes its samples to files in this
+# directory and /metrics aggregates all of them.
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+# Models come from the client; cap the label cardinality.
+METRICS_MAX_MODELS = int(os.getenv('METRICS_MAX_MODELS', '100'))
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+_GAP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STREAM_TTFT = Histogram(
+    "poe_stream_ttft_seconds", "Time from request arrival to the first text chunk.",
+    ["model", "endpoint"], buckets=_LATENCY_BUCKETS
+)
+STREAM_INTER_CHUNK = Histogram(
+    "poe_stream_inter_chunk_seconds", "Gap between consecutive text chunks.",
+    ["model", "endpoint"], buckets=_GAP_BUCKETS
+)
+STREAM_DURATION = Histogram(
+    "poe_stream_duration_seconds", "Time from request arrival to the end of the text stream.",
+    ["model", "endpoint"], buckets=_LATENCY_BUCKETS + (300.0, 600.0)
+)
+STREAM_CHUNKS = Histogram(
+    "poe_stream_output_chunks", "Text chunks per reply.",
+    ["model", "endpoint"], buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "poe_stream_output_tokens_per_second", "Output tokens per second after the first chunk.",
+    ["model", "endpoint"], buckets=(1, 5, 10, 20, 40, 60, 80, 120, 160, 250, 500)
+)
+STREAMS_IN_FLIGHT = Gauge(
+    "poe_streams_in_flight", "Replies currently being produced.",
+    ["model", "endpoint"], multiprocess_mode="livesum"
+)
+UPLOAD_LATENCY = Histogram(
+    "poe_upload_latency_seconds", "Latency of image uploads to Poe.",
+    buckets=_LATENCY_BUCKETS
+)
+REQUEST_BODY_BYTES = Histogram(
+    "poe_request_body_bytes", "Request body size from Content-Length.",
+    ["endpoint"], buckets=(1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20, 1 << 22, 1 << 24, 1 << 26)
+)
+IMAGE_MEMORY_RESERVED = Gauge(
+    "poe_image_memory_reserved_bytes", "Decoded image bytes reserved from the worker budget.",
+    multiprocess_mode="livesum"
+)
+IMAGE_BUDGET_REJECTIONS = Counter(
+    "poe_image_budget_rejections", "Requests rejected by the image memory budget.",
+    ["reason"]
+)
+IMAGE_SPILLS = Counter(
+    "poe_image_spills", "Images decoded to a temporary file instead of memory."
+)
+CANCELLED_GENERATIONS = Counter(
+    "poe_cancelled_generations", "Upstream generations cancelled because nobody was left to read them.",
+    ["bot"]
+)
+CANCELLED_SECONDS_SAVED = Counter(
+    "poe_cancelled_generation_seconds_saved",
+    "Estimated upstream generation time avoided by cancelling, from each bot's average generation time.",
+    ["bot"]
+)
+BATCH_REQUESTS = Counter(
+    "poe_batch_requests", "Batch request lines executed, by result.",
+    ["result"]
+)
+UPSTREAM_ERRORS = Counter(
+    "poe_upstream_errors", "Failed upstream attempts.",
+    ["bot"]
+)
+ATTACHMENT_CACHE_LOOKUPS = Counter(
+    "poe_attachment_cache", "Attachment cache lookups by tier and result.",
+    ["tier", "result"]
+)
+
+_known_models: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def model_label(model: str) -> str:
+    if model in _known_models:
+        return model
+    if len(_known_models) < METRICS_MAX_MODELS:
+        _known_models.add(model)
+        return model
+    return "other"
+
+
+async def instrument_stream(
+    text_chunks: AsyncIterator[str],
+    model: str,
+    endpoint: str,
+    started_at: float
+) -> AsyncIterator[str]:
+    """Pass `text_chunks` through while recording stream metrics.
+
+    The per-chunk path only takes a timestamp and appends to local lists;
+    histograms are observed once the stream is over. `started_at` is a
+    `time.perf_counter()` value from when the request arrived.
+    """
+    labels = (model_label(model), endpoint)
+    in_flight = STREAMS_IN_FLIGHT.labels(*labels)
+    in_flight.inc()
+
+    timestamps: List[float] = []
+    chunks: List[str] = []
+    completed = False
+    try:
+        async for text_chunk in text_chunks:
+            timestamps.append(time.perf_counter())
+            chunks.append(text_chunk)
+            yield text_chunk
+        completed = True
+    finally:
+        in_flight.dec()
+        _observe_stream(labels, started_at, timestamps)
+
+    if completed and len(timestamps) > 1 and timestamps[-1] > timestamps[0]:
+        # Tokenizing the reply must not delay the end of the stream.
+        task = asyncio.ensure_future(_observe_tokens_per_second(
+            labels, "".join(chunks), timestamps[-1] - timestamps[0]
+        ))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+async def _observe_tokens_per_second(labels: Tuple[str, str], text: str, seconds: float) -> None:
+    try:
+        output_tokens = (await count_tokens_many([text]))[0]
+    except Exception as e:
+        logger.warning(f"Failed to count output tokens for metrics: {e}")
+        return
+    STREAM_TOKENS_PER_SECOND.labels(*labels).observe(output_tokens / seconds)
+
+
+def _observe_stream(labels: Tuple[str, str], started_at: float, timestamps: List[float]) -> None:
+    STREAM_DURATION.labels(*labels).observe(time.perf_counter() - started_at)
+    STREAM_CHUNKS.labels(*labels).observe(len(timestamps))
+    if not timestamps:
+        return
+
+    STREAM_TTFT.labels(*labels).observe(timestamps[0] - started_at)
+    observe_gap = STREAM_INTER_CHUNK.labels(*labels).observe
+    for previous, current in zip(timestamps, timestamps[1:]):
+        observe_gap(current - previous)
+
+
+class RequestSizeMiddleware:
+    """Record Content-Length of requests to the instrumented endpoints."""
+
+    def __init__(self, app, endpoints: Iterable[str] = INSTRUMENTED_ENDPOINTS):
+        self.app = app
+        self.endpoints = frozenset(endpoints)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.endpoints:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    try:
+                        REQUEST_BODY_BYTES.labels(scope["path"]).observe(int(value))
+                    except ValueError:
+                        pass
+                    break
+        await self.app(scope, receive, send)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    if PROMETHEUS_MULTIPROC_DIR is None:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_stopped() -> None:
+    """Drop this worker's live gauges from the multi-process aggregate."""
+    if PROMETHEUS_MULTIPROC_DIR is not None:
+        multiprocess.mark_process_dead(os.getpid(), path=PROMETHEUS_MULTIPROC_DIR)
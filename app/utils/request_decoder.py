@@ -0,0 +1,222 @@
+from typing import Any, Dict, List, Optional, Tuple
+from app.models.request_models import ClientRequest, ClientInput
+from app.models.request_models import ClientInputTextContent, ClientInputImgContent
+from .data_url import DataUrl
+
+import orjson
+import os
+
+
+# Image data URLs at least this long are lifted out of the body before
+# JSON decoding and handed on as memoryview slices of it.
+ZERO_COPY_MIN_BYTES = int(os.getenv('ZERO_COPY_MIN_BYTES', '4096'))
+
+_DATA_URL_START = b'"data:image/'
+_PLACEHOLDER = "\x00image:{}"
+
+
+class _Fallback(Exception):
+    """The body is not in a shape the fast path handles."""
+
+
+def _lift_data_urls(body: bytes) -> Tuple[bytes, Dict[str, memoryview]]:
+    """Replace large image data URL strings with short placeholders.
+
+    Returns `(stripped_body, {placeholder: memoryview})`. Only strings
+    that start right after `:`, `[` or `,` are taken: a quote inside a
+    JSON string is always escaped, so these are real string starts.
+    Strings with escape sequences are left for the JSON decoder.
+    """
+    view = memoryview(body)
+    pieces: List[Any] = []
+    slices: Dict[str, memoryview] = {}
+    position = 0
+    start = body.find(_DATA_URL_START)
+
+    while start != -1:
+        end = body.find(b'"', start + 1)
+        if end == -1:
+            break
+
+        before = start - 1
+        while before >= 0 and body[before] in b" \t\r\n":
+            before -= 1
+        if (
+            end - start - 1 >= ZERO_COPY_MIN_BYTES
+            and before >= 0 and body[before] in b":[,"
+            and body.find(b"\\", start, end) == -1
+        ):
+            placeholder = _PLACEHOLDER.format(len(slices))
+            slices[placeholder] = view[start + 1:end]
+            pieces.append(view[position:start])
+            pieces.append(orjson.dumps(placeholder))
+            position = end + 1
+
+        start = body.find(_DATA_URL_START, end + 1)
+
+    if not slices:
+        return body, slices
+
+    pieces.append(view[position:])
+    return b"".join(pieces), slices
+
+
+class _Normalizer:
+    """Single-pass equivalent of ClientRequest's before-validators.
+
+    Anything the model would coerce, transform differently or reject
+    raises `_Fallback`, so validation errors still come from pydantic.
+    """
+
+    def __init__(self, slices: Dict[str, memoryview]):
+        self.slices = slices
+        self.used = 0
+
+    def image_url(self, value: Any) -> DataUrl:
+        if not isinstance(value, str):
+            raise _Fallback()
+        data_url = self.slices.get(value)
+        if data_url is None:
+            return value
+        self.used += 1
+        return data_url
+
+    def text_item(self, item: Dict[str, Any], content_type: Optional[str]) -> ClientInputTextContent:
+        text = item.get("text")
+        if not isinstance(text, str) or "image_url" in item:
+            raise _Fallback()
+        return ClientInputTextContent(text=text, type=content_type)
+
+    def chat_item(self, item: Any):
+        if not isinstance(item, dict):
+            raise _Fallback()
+        content_type = item.get("type")
+        if content_type == "image_url":
+            image_url = item.get("image_url")
+            if isinstance(image_url, dict):
+                image_url = image_url.get("url")
+            if "text" in item:
+                raise _Fallback()
+            return ClientInputImgContent.model_construct(
+                detail="auto", type="input_image", image_url=self.image_url(image_url)
+            )
+        if content_type == "text":
+            content_type = "input_text"
+        if content_type is not None and not isinstance(content_type, str):
+            raise _Fallback()
+        return self.text_item(item, content_type)
+
+    def input_item(self, item: Any):
+        if not isinstance(item, dict):
+            raise _Fallback()
+        content_type = item.get("type")
+        if content_type == "input_image" and "text" not in item:
+            detail = item.get("detail")
+            if not isinstance(detail, str):
+                raise _Fallback()
+            return ClientInputImgContent.model_construct(
+                detail=detail, type=content_type, image_url=self.image_url(item.get("image_url"))
+            )
+        if content_type is not None and not isinstance(content_type, str):
+            raise _Fallback()
+        return self.text_item(item, content_type)
+
+    def message(self, msg: Any, default_role: Optional[str], item) -> ClientInput:
+        if not isinstance(msg, dict):
+            raise _Fallback()
+        role = msg.get("role", default_role)
+        content = msg.get("content")
+        if not isinstance(role, str):
+            raise _Fallback()
+
+        if isinstance(content, str):
+            items = [ClientInputTextContent(text=content, type="input_text")]
+        elif isinstance(content, list):
+            items = [item(content_item) for content_item in content]
+        else:
+            raise _Fallback()
+        return ClientInput(role=role, content=items)
+
+    def messages(self, data: Dict[str, Any]) -> List[ClientInput]:
+        messages = data.get("messages")
+        if messages:
+            if not isinstance(messages, list):
+                raise _Fallback()
+            return [self.message(msg, "user", self.chat_item) for msg in messages]
+
+        source = data.get("input", [])
+        if isinstance(source, str):
+            return [ClientInput(
+                role="user",
+                content=[ClientInputTextContent(text=source, type="input_text")]
+            )]
+        if not isinstance(source, list):
+            raise _Fallback()
+        return [self.message(msg, None, self.input_item) for msg in source]
+
+
+def _optional_str(data: Dict[str, Any], key: str) -> Optional[str]:
+    value = data.get(key)
+    if value is not None and not isinstance(value, str):
+        raise _Fallback()
+    return value
+
+
+def _fast_request(data: Any, slices: Dict[str, memoryview]) -> ClientRequest:
+    if not isinstance(data, dict) or not isinstance(data.get("model"), str):
+        raise _Fallback()
+
+    normalizer = _Normalizer(slices)
+    client_input = normalizer.messages(data)
+    # A lifted string outside an image position (e.g. a data URL pasted as
+    # text) would otherwise be left as a placeholder.
+    if normalizer.used != len(slices):
+        raise _Fallback()
+
+    stream = data.get("stream", False)
+    store = data.get("store", True)
+    if not isinstance(stream, bool) or not isinstance(store, bool):
+        raise _Fallback()
+    temperature = data.get("temperature")
+    if temperature is not None and (isinstance(temperature, bool) or not isinstance(temperature, (int, float))):
+        raise _Fallback()
+
+    return ClientRequest.model_construct(
+        model=data["model"],
+        input=client_input,
+        stream=stream,
+        service_tier=_optional_str(data, "service_tier"),
+        temperature=float(temperature) if temperature is not None else None,
+        previous_response_id=_optional_str(data, "previous_response_id"),
+        store=store
+    )
+
+
+def decode_client_request(body: bytes) -> ClientRequest:
+    """Parse a `/v1/responses` or `/v1/chat/completions` body.
+
+    Produces the same normalized `ClientRequest` as
+    `ClientRequest.model_validate(json.loads(body))`, but large image
+    data URLs are never decoded to `str`: `image_url` holds a memoryview
+    slice of `body` instead, which `to_poe_message` decodes in place.
+    Bodies the fast path does not recognize are validated by pydantic.
+
+    Raises `orjson.JSONDecodeError` or `pydantic.ValidationError`.
+    """
+    stripped_body, slices = _lift_data_urls(body)
+    try:
+        data = orjson.loads(stripped_body)
+    except orjson.JSONDecodeError:
+        if not slices:
+            raise
+        # Report the error against the body the client actually sent.
+        data = orjson.loads(body)
+
+    try:
+        return _fast_request(data, slices)
+    except _Fallback:
+        pass
+
+    if slices:
+        data = orjson.loads(body)
+    return ClientRequest.model_validate(data)
@@ -0,0 +1,160 @@
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from datetime import timedelta
+
+import redis.asyncio as aioredis
+import fastapi_poe as fp
+import hashlib
+import logging
+import redis
+import json
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def request_cache_key(
+    model: str,
+    protocol_messages: List[fp.ProtocolMessage],
+    temperature: Optional[float],
+    owner: str
+) -> str:
+    """Canonical hash of everything that determines a bot reply.
+
+    `owner` is the hashed API key (`owner_of`): a reply is only ever
+    served back to the key that paid for it.
+    """
+    canonical = {
+        "owner": owner,
+        "model": model,
+        "temperature": temperature,
+        "messages": [
+            [
+                message.role,
+                message.content,
+                [[attachment.url, attachment.content_type] for attachment in message.attachments or []]
+            ]
+            for message in protocol_messages
+        ],
+    }
+    encoded = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Exact-match cache of completed bot replies.
+
+    Entries are keyed by a canonical hash of the API key, the model, the converted
+    protocol messages (attachments by URL and content type) and the
+    sampling parameters, and hold the reply as the list of text chunks
+    the bot streamed, so a hit can be replayed with the original chunk
+    boundaries. Only explicitly deterministic requests (`temperature=0`)
+    are cached.
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        enabled: bool = None,
+        cache_ttl: int = None,
+        max_bytes: int = None
+    ):
+        if enabled is None:
+            enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        if cache_ttl is None:
+            cache_ttl = int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+        if max_bytes is None:
+            max_bytes = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(1 << 20)))
+
+        self.redis_client = redis_client
+        self.enabled = enabled
+        self.cache_ttl = cache_ttl
+        self.max_bytes = max_bytes
+        self.key_prefix = "completion_cache:"
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0, "errors": 0}
+
+    def stats(self) -> Dict[str, int]:
+        return self._stats.copy()
+
+    def is_cacheable(self, temperature: Optional[float]) -> bool:
+        return self.enabled and temperature is not None and temperature == 0
+
+    def make_key(
+        self,
+        model: str,
+        protocol_messages: List[fp.ProtocolMessage],
+        temperature: Optional[float],
+        owner: str
+    ) -> str:
+        return f"{self.key_prefix}{request_cache_key(model, protocol_messages, temperature, owner)}"
+
+    async def get(self, cache_key: str) -> Optional[List[str]]:
+        try:
+            cached_data = await self.redis_client.get(cache_key)
+        except redis.exceptions.RedisError as e:
+            self._stats["errors"] += 1
+            logger.error(f"Error reading response cache {cache_key[-12:]}: {e}")
+            return None
+
+        if not cached_data:
+            self._stats["misses"] += 1
+            return None
+
+        try:
+            chunks = json.loads(cached_data)
+        except json.JSONDecodeError as e:
+            self._stats["errors"] += 1
+            logger.error(f"Corrupt response cache entry {cache_key[-12:]}: {e}")
+            return None
+
+        self._stats["hits"] += 1
+        logger.info(f"Response cache hit: {cache_key[-12:]}")
+        return chunks
+
+    async def set(self, cache_key: str, chunks: List[str]) -> bool:
+        cached_data = json.dumps(chunks, ensure_ascii=False)
+        if len(cached_data) > self.max_bytes:
+            logger.info(f"Response too large to cache: {cache_key[-12:]}")
+            return False
+
+        try:
+            success = await self.redis_client.setex(
+                cache_key,
+                timedelta(seconds=self.cache_ttl),
+                cached_data
+            )
+        except redis.exceptions.RedisError as e:
+            self._stats["errors"] += 1
+            logger.error(f"Error writing response cache {cache_key[-12:]}: {e}")
+            return False
+
+        if success:
+            self._stats["stores"] += 1
+        return bool(success)
+
+    def bypass(self) -> None:
+        self._stats["bypassed"] += 1
+
+    async def record(
+        self,
+        cache_key: str,
+        text_chunks: AsyncIterator[str],
+        store_if: Optional[Callable[[], bool]] = None
+    ) -> AsyncIterator[str]:
+        """Pass `text_chunks` through and cache them once fully consumed.
+
+        Replies cut short by an upstream error or a client disconnect are
+        never stored, nor are replies for which `store_if()` is false.
+        """
+        chunks: List[str] = []
+        async for text_chunk in text_chunks:
+            chunks.append(text_chunk)
+            yield text_chunk
+
+        if chunks and (store_if is None or store_if()):
+            await self.set(cache_key, chunks)
+
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncIterator[str]:
+        for text_chunk in chunks:
+            yield text_chunk
@@ -0,0 +1,250 @@
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+# Set by `python -m app.serve`; caches fall back to per-process LRUs when unset.
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR') or None
+
+_MAGIC = b"POESHMC1"
+# magic, slot count, ways per bucket, value capacity per slot
+_HEADER = struct.Struct("<8sIII")
+_HEADER_SIZE = 64
+# key digest, expires at (0 = never), last used, value length
+_SLOT = struct.Struct("<16sddI")
+_EMPTY_KEY = bytes(16)
+
+
+def shared_cache_available() -> bool:
+    return SHARED_CACHE_DIR is not None and fcntl is not None
+
+
+class SharedMemoryCache(Generic[V]):
+    """Bounded cache in an mmap-ed file shared by all workers on a host.
+
+    Slots are grouped into buckets of `ways` entries; a key can only live
+    in the bucket its digest maps to. A full bucket evicts its expired
+    entry, or else its least recently used one, so the segment never grows.
+    Each operation takes an fcntl lock on its bucket's byte range only,
+    so workers touching different keys do not contend.
+
+    Keys are hashed from their `repr`, so they must be built from str,
+    bytes, ints and tuples. Values go through `encode`/`decode` and are
+    not stored when they encode to more than `value_size` bytes.
+
+    Like `LRUCache`, an instance is meant to be used from one thread;
+    the locks only serialize different processes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        slots: int,
+        value_size: int,
+        encode: Callable[[V], bytes],
+        decode: Callable[[bytes], V],
+        ttl: Optional[float] = None,
+        ways: int = 8
+    ):
+        if fcntl is None:
+            raise RuntimeError("SharedMemoryCache requires fcntl")
+        if slots <= 0 or value_size <= 0 or ways <= 0:
+            raise ValueError("slots, value_size and ways must be positive integers")
+
+        self.path = path
+        self.ways = ways
+        self.buckets = max(1, slots // ways)
+        self.slots = self.buckets * ways
+        self.value_size = value_size
+        self.ttl = ttl
+        self._encode = encode
+        self._decode = decode
+        self._slot_size = _SLOT.size + value_size
+        self._bucket_size = self._slot_size * ways
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._initialize()
+            self._mmap = mmap.mmap(self._fd, _HEADER_SIZE + self.buckets * self._bucket_size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def _initialize(self) -> None:
+        """Size and format the segment, or reuse it if the geometry matches."""
+        expected = _HEADER.pack(_MAGIC, self.slots, self.ways, self.value_size)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if header == expected:
+                return
+            if header:
+                logger.warning(f"Shared cache {self.path} has a different layout, reformatting it.")
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, _HEADER_SIZE + self.buckets * self._bucket_size)
+            os.pwrite(self._fd, expected, 0)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._mmap.close()
+        os.close(self._fd)
+
+    @staticmethod
+    def _digest(key: Hashable) -> bytes:
+        digest = hashlib.blake2b(repr(key).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        return digest if digest != _EMPTY_KEY else b"\x01" + digest[1:]
+
+    def _bucket_offset(self, digest: bytes) -> int:
+        return _HEADER_SIZE + (int.from_bytes(digest[:8], "little") % self.buckets) * self._bucket_size
+
+    def _lock(self, offset: int) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._bucket_size, offset)
+
+    def _unlock(self, offset: int) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self._bucket_size, offset)
+
+    def _find(self, bucket: int, digest: bytes) -> int:
+        for way in range(self.ways):
+            offset = bucket + way * self._slot_size
+            if self._mmap[offset:offset + 16] == digest:
+                return offset
+        return -1
+
+    def __len__(self) -> int:
+        now = time.time()
+        count = 0
+        for bucket in range(self.buckets):
+            offset = _HEADER_SIZE + bucket * self._bucket_size
+            self._lock(offset)
+            try:
+                for way in range(self.ways):
+                    key, expires_at, _, _ = _SLOT.unpack_from(self._mmap, offset + way * self._slot_size)
+                    if key != _EMPTY_KEY and not (expires_at and expires_at <= now):
+                        count += 1
+            finally:
+                self._unlock(offset)
+        return count
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        digest = self._digest(key)
+        bucket = self._bucket_offset(digest)
+        self._lock(bucket)
+        try:
+            offset = self._find(bucket, digest)
+            if offset == -1:
+                return default
+
+            _, expires_at, _, length = _SLOT.unpack_from(self._mmap, offset)
+            now = time.time()
+            if expires_at and expires_at <= now:
+                self._mmap[offset:offset + 16] = _EMPTY_KEY
+                return default
+
+            _SLOT.pack_into(self._mmap, offset, digest, expires_at, now, length)
+            value = self._mmap[offset + _SLOT.size:offset + _SLOT.size + length]
+        finally:
+            self._unlock(bucket)
+
+        return self._decode(value)
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        data = self._encode(value)
+        if len(data) > self.value_size:
+            logger.debug(f"Value of {len(data)} bytes does not fit in shared cache {self.path}")
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else 0.0
+        digest = self._digest(key)
+        bucket = self._bucket_offset(digest)
+        self._lock(bucket)
+        try:
+            offset = self._find(bucket, digest)
+            if offset == -1:
+                offset = self._victim(bucket, now)
+            _SLOT.pack_into(self._mmap, offset, digest, expires_at, now, len(data))
+            self._mmap[offset + _SLOT.size:offset + _SLOT.size + len(data)] = data
+        finally:
+            self._unlock(bucket)
+
+    def _victim(self, bucket: int, now: float) -> int:
+        oldest_offset, oldest_used = bucket, None
+        for way in range(self.ways):
+            offset = bucket + way * self._slot_size
+            key, expires_at, last_used, _ = _SLOT.unpack_from(self._mmap, offset)
+            if key == _EMPTY_KEY or (expires_at and expires_at <= now):
+                return offset
+            if oldest_used is None or last_used < oldest_used:
+                oldest_offset, oldest_used = offset, last_used
+        return oldest_offset
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        digest = self._digest(key)
+        bucket = self._bucket_offset(digest)
+        self._lock(bucket)
+        try:
+            offset = self._find(bucket, digest)
+            if offset == -1:
+                return default
+
+            _, expires_at, _, length = _SLOT.unpack_from(self._mmap, offset)
+            self._mmap[offset:offset + 16] = _EMPTY_KEY
+            if expires_at and expires_at <= time.time():
+                return default
+            value = self._mmap[offset + _SLOT.size:offset + _SLOT.size + length]
+        finally:
+            self._unlock(bucket)
+
+        return self._decode(value)
+
+    def clear(self) -> None:
+        for bucket in range(self.buckets):
+            offset = _HEADER_SIZE + bucket * self._bucket_size
+            self._lock(offset)
+            try:
+                for way in range(self.ways):
+                    slot = offset + way * self._slot_size
+                    self._mmap[slot:slot + 16] = _EMPTY_KEY
+            finally:
+                self._unlock(offset)
+
+
+def open_shared_cache(
+    name: str,
+    slots: int,
+    value_size: int,
+    encode: Callable[[V], bytes],
+    decode: Callable[[bytes], V],
+    ttl: Optional[float] = None
+) -> Optional[SharedMemoryCache[V]]:
+    """Open `name` in `SHARED_CACHE_DIR`, or return None outside multi-worker mode."""
+    if not shared_cache_available():
+        return None
+    try:
+        cache = SharedMemoryCache(
+            os.path.join(SHARED_CACHE_DIR, f"{name}.cache"), slots, value_size, encode, decode, ttl=ttl
+        )
+    except OSError as e:
+        logger.error(f"Failed to open shared cache {name} in {SHARED_CACHE_DIR}, using a local one: {e}")
+        return None
+    logger.info(f"Using shared cache {cache.path} ({cache.slots} slots of {value_size} bytes)")
+    return cache
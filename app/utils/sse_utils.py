@@ -1,7 +1,15 @@
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, AsyncIterator, List, Optional, Union
 
+import asyncio
+import contextlib
 import json
+import os
+import time
+
+
+SSE_COALESCE_WINDOW_MS = float(os.getenv('SSE_COALESCE_WINDOW_MS', '0'))
+SSE_COALESCE_MAX_BYTES = int(os.getenv('SSE_COALESCE_MAX_BYTES', '16384'))
 
 
 class SSEFormatter(BaseModel):
@@ -12,4 +20,118 @@ class SSEFormatter(BaseModel):
 
     def format_chat_completion(self, data: Any) -> str:
         data_json = json.dumps(data) if not isinstance(data, str) else data
-        return f"data: {data_json}\n\n"
\ No newline at end of file
+        return f"data: {data_json}\n\n"
+
+
+def coalesce_sse_frames(
+    frames: AsyncIterator[Union[str, bytes]],
+    window_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[Union[str, bytes]]:
+    """Merge adjacent SSE frames into fewer, larger writes.
+
+    Off unless a positive window is configured (SSE_COALESCE_WINDOW_MS),
+    in which case `frames` is returned untouched. Frames that arrive after
+    the stream has been quiet for a whole window are written immediately,
+    so the first token is never delayed. Frames that follow within the
+    window are buffered until the window closes or `max_bytes` is reached.
+    """
+    window_ms = SSE_COALESCE_WINDOW_MS if window_ms is None else window_ms
+    max_bytes = SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+    if window_ms <= 0:
+        return frames
+
+    return _coalesce(frames, window_ms / 1000, max_bytes)
+
+
+_END_OF_FRAMES = object()
+
+
+async def _read_frames(frames: AsyncIterator[Union[str, bytes]], queue: asyncio.Queue) -> None:
+    # The whole upstream chain is driven from this one task, so context
+    # variables set while producing a frame are still set for the next
+    # one, and cancelling the task is what stops the upstream.
+    iterator = frames.__aiter__()
+    try:
+        while True:
+            try:
+                frame = await iterator.__anext__()
+            except StopAsyncIteration:
+                await queue.put(_END_OF_FRAMES)
+                return
+            except BaseException as e:
+                if asyncio.current_task().cancelling():
+                    raise
+                await queue.put(e)
+                return
+            await queue.put(frame)
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def _coalesce(
+    frames: AsyncIterator[Union[str, bytes]],
+    window: float,
+    max_bytes: int
+) -> AsyncIterator[bytes]:
+    # One frame of read-ahead, as when iterating `frames` directly.
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    reader = asyncio.ensure_future(_read_frames(frames, queue))
+    buffer: List[bytes] = []
+    buffered_bytes = 0
+    last_flush = float("-inf")
+    next_frame: Optional[asyncio.Future] = None
+
+    try:
+        while True:
+            if next_frame is None:
+                next_frame = asyncio.ensure_future(queue.get())
+
+            if buffer:
+                timeout = max(0.0, last_flush + window - time.monotonic())
+                await asyncio.wait({next_frame}, timeout=timeout)
+                if not next_frame.done():
+                    yield b"".join(buffer)
+                    buffer, buffered_bytes = [], 0
+                    last_flush = time.monotonic()
+                    continue
+            else:
+                await asyncio.wait({next_frame})
+
+            frame = next_frame.result()
+            next_frame = None
+            if frame is _END_OF_FRAMES:
+                break
+            if isinstance(frame, BaseException):
+                if buffer:
+                    yield b"".join(buffer)
+                    buffer = []
+                raise frame
+
+            if isinstance(frame, str):
+                frame = frame.encode("utf-8")
+
+            now = time.monotonic()
+            if not buffer and now - last_flush >= window:
+                yield frame
+                last_flush = time.monotonic()
+                continue
+
+            buffer.append(frame)
+            buffered_bytes += len(frame)
+            if buffered_bytes >= max_bytes:
+                yield b"".join(buffer)
+                buffer, buffered_bytes = [], 0
+                last_flush = time.monotonic()
+
+        if buffer:
+            yield b"".join(buffer)
+
+    finally:
+        for task in (next_frame, reader):
+            if task is not None and not task.done():
+                task.cancel()
+                with contextlib.suppress(BaseException):
+                    await task
@@ -0,0 +1,167 @@
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import asyncio
+import logging
+import weakref
+import copy
+import os
+
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class SubscriberOverflow(Exception):
+    pass
+
+
+class SharedStreamError(Exception):
+    """Stand-in for an upstream error that cannot be copied per subscriber."""
+
+
+def _clone_error(error: BaseException) -> BaseException:
+    # Every subscriber raises its own instance; raising one shared object
+    # from several tasks would interleave their tracebacks.
+    try:
+        return copy.copy(error)
+    except Exception:
+        return SharedStreamError(str(error))
+
+
+class _Subscriber:
+    __slots__ = ("queue", "limit")
+
+    def __init__(self, history: List[str], buffer_size: int):
+        # Unbounded queue with a soft limit, so the terminal item always fits.
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.limit = len(history) + buffer_size
+        for text_chunk in history:
+            self.queue.put_nowait(text_chunk)
+
+
+class _Flight:
+    __slots__ = ("key", "history", "subscribers", "task")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.history: List[str] = []
+        self.subscribers: Set[_Subscriber] = set()
+        self.task: Optional[asyncio.Task] = None
+
+
+class StreamCoalescer:
+    """Single-flight fan-out of identical in-flight upstream streams.
+
+    The first request for a key starts the upstream stream in its own
+    task; identical requests arriving while it runs subscribe to it and
+    receive the chunks produced so far followed by the live ones. Every
+    subscriber reads from its own bounded buffer, so no client owns the
+    upstream: a subscriber leaving (the leader included) only detaches it,
+    and the upstream is cancelled once nobody is listening. A subscriber
+    that falls more than `buffer_size` chunks behind is dropped with
+    `SubscriberOverflow` instead of holding back the others, and one whose
+    stream is discarded without ever being iterated is detached when it is
+    garbage collected.
+    """
+
+    def __init__(self, enabled: bool = None, buffer_size: int = None):
+        if enabled is None:
+            enabled = os.getenv('SINGLE_FLIGHT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        if buffer_size is None:
+            buffer_size = int(os.getenv('SINGLE_FLIGHT_BUFFER', '256'))
+
+        self.enabled = enabled
+        self.buffer_size = buffer_size
+        self._flights: Dict[str, _Flight] = {}
+        self._stats: Dict[str, int] = {"leaders": 0, "followers": 0, "overflows": 0, "cancelled": 0}
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "in_flight": len(self._flights)}
+
+    def is_coalescable(self, temperature: Optional[float]) -> bool:
+        return self.enabled and temperature is not None and temperature == 0
+
+    def subscribe(
+        self,
+        key: str,
+        create: Callable[[], AsyncIterator[str]]
+    ) -> Tuple[AsyncIterator[str], bool]:
+        """Return `(text_chunks, joined)` for `key`.
+
+        `create()` is only called when no identical stream is in flight;
+        `joined` tells whether an existing one was reused.
+        """
+        flight = self._flights.get(key)
+        joined = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight(key)
+            flight.task = asyncio.ensure_future(self._pump(flight, create()))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+            logger.info(f"Joining in-flight stream {key[-12:]} ({len(flight.subscribers)} subscribers)")
+
+        subscriber = _Subscriber(flight.history, self.buffer_size)
+        flight.subscribers.add(subscriber)
+        text_chunks = self._consume(flight, subscriber)
+        # An async generator that never starts never runs its `finally`.
+        weakref.finalize(text_chunks, self._abandon, flight, subscriber)
+        return text_chunks, joined
+
+    def _finish(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def _pump(self, flight: _Flight, source: AsyncIterator[str]) -> None:
+        terminal: object = _DONE
+        try:
+            async for text_chunk in source:
+                flight.history.append(text_chunk)
+                for subscriber in list(flight.subscribers):
+                    if subscriber.queue.qsize() >= subscriber.limit:
+                        self._stats["overflows"] += 1
+                        flight.subscribers.discard(subscriber)
+                        subscriber.queue.put_nowait(SubscriberOverflow("Client fell too far behind the shared stream."))
+                        continue
+                    subscriber.queue.put_nowait(text_chunk)
+        except asyncio.CancelledError:
+            terminal = ConnectionError("Shared upstream stream was cancelled.")
+            raise
+        except Exception as e:
+            terminal = e
+        finally:
+            self._finish(flight)
+            for subscriber in flight.subscribers:
+                subscriber.queue.put_nowait(terminal)
+            await source.aclose()
+
+    def _detach(self, flight: _Flight, subscriber: _Subscriber) -> None:
+        flight.subscribers.discard(subscriber)
+        if not flight.subscribers and not flight.task.done():
+            self._stats["cancelled"] += 1
+            logger.info(f"Last subscriber left, cancelling stream {flight.key[-12:]}")
+            self._finish(flight)
+            flight.task.cancel()
+
+    def _abandon(self, flight: _Flight, subscriber: _Subscriber) -> None:
+        if subscriber in flight.subscribers:
+            self._detach(flight, subscriber)
+
+    async def _consume(self, flight: _Flight, subscriber: _Subscriber) -> AsyncIterator[str]:
+        try:
+            while True:
+                item = await subscriber.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise _clone_error(item) from item
+                yield item
+        finally:
+            self._detach(flight, subscriber)
+
+    async def close(self) -> None:
+        tasks = [flight.task for flight in self._flights.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
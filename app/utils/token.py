@@ -1,11 +1,122 @@
-import tiktoken
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from .lru_cache import LRUCache
+from .shared_cache import open_shared_cache
 
+import asyncio
+import hashlib
+import os
+
+if TYPE_CHECKING:
+    import tiktoken
+
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '8192'))
+# Uncached text below this many characters is tokenized inline; dispatching
+# to a thread costs more than encoding a few kilobytes.
+TOKENIZE_INLINE_THRESHOLD = int(os.getenv('TOKENIZE_INLINE_THRESHOLD', '32768'))
+TOKENIZE_THREADS = int(os.getenv('TOKENIZE_THREADS', '4'))
+
+# In multi-worker mode counts are shared by all workers on the host.
+_token_count_cache = open_shared_cache(
+    "token_counts",
+    slots=int(os.getenv('SHARED_CACHE_TOKEN_SLOTS', '262144')),
+    value_size=4,
+    encode=lambda token_count: token_count.to_bytes(4, "little"),
+    decode=lambda data: int.from_bytes(data, "little")
+)
+if _token_count_cache is None:
+    _token_count_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+_tokenize_executor = ThreadPoolExecutor(max_workers=TOKENIZE_THREADS, thread_name_prefix="tokenize")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o") -> "tiktoken.Encoding":
+    # Imported here so workers do not pay for it until warm-up.
+    import tiktoken
 
-def count_tokens(text: str, model: str = "gpt-4o") -> int:
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    token_ids = get_encoding(model).encode(text)
+    return len(token_ids)
+
+
+def warm_up_encoding(model: str = "gpt-4o") -> None:
+    """Load the BPE ranks and compile the split pattern for `model`."""
+    get_encoding(model).encode("warm up")
+
+
+async def warm_up_encoding_async(model: str = "gpt-4o") -> None:
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_tokenize_executor, warm_up_encoding, model)
+
+
+def _token_cache_key(text: str, model: str):
+    return model, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def count_tokens_cached(text: str, model: str = "gpt-4o") -> int:
+    """Like `count_tokens`, memoized by content digest.
+
+    Chat history is resent on every turn, so only new messages pay for
+    tokenization.
+    """
+    key = _token_cache_key(text, model)
+    token_count = _token_count_cache.get(key)
+    if token_count is None:
+        token_count = count_tokens(text, model)
+        _token_count_cache.set(key, token_count)
+
+    return token_count
+
+
+def _count_tokens_batch(texts: List[str], model: str) -> List[int]:
+    # tiktoken releases the GIL while encoding, so this runs in parallel
+    # with the event loop and with the other batch threads. `encode_batch`
+    # is avoided: it starts a thread pool of its own on every call.
+    encoding = get_encoding(model)
+    return [len(encoding.encode(text)) for text in texts]
+
+
+async def count_tokens_many(texts: List[str], model: str = "gpt-4o") -> List[int]:
+    """Cached token counts for `texts`, tokenizing misses off the event loop.
+
+    Misses are deduplicated and encoded as one batch. Small batches stay
+    inline; larger ones are split across the tokenize pool so concurrent
+    streams keep flowing while a long prompt is tokenized.
+    """
+    keys: List[Tuple[str, bytes]] = [_token_cache_key(text, model) for text in texts]
+    counts = [_token_count_cache.get(key) for key in keys]
+
+    missing: Dict[Tuple[str, bytes], str] = {}
+    for key, text, token_count in zip(keys, texts, counts):
+        if token_count is None:
+            missing.setdefault(key, text)
+
+    if missing:
+        missing_texts = list(missing.values())
+        if sum(len(text) for text in missing_texts) < TOKENIZE_INLINE_THRESHOLD:
+            missing_counts = [count_tokens(text, model) for text in missing_texts]
+        else:
+            loop = asyncio.get_running_loop()
+            step = -(-len(missing_texts) // TOKENIZE_THREADS)
+            slice_counts = await asyncio.gather(*(
+                loop.run_in_executor(_tokenize_executor, _count_tokens_batch, missing_texts[i:i + step], model)
+                for i in range(0, len(missing_texts), step)
+            ))
+            missing_counts = [token_count for counts_slice in slice_counts for token_count in counts_slice]
+
+        resolved = dict(zip(missing, missing_counts))
+        for key, token_count in resolved.items():
+            _token_count_cache.set(key, token_count)
+
+        counts = [resolved[key] if token_count is None else token_count
+                  for key, token_count in zip(keys, counts)]
 
-    token_ids = encoding.encode(text)
-    return len(token_ids)
\ No newline at end of file
+    return counts
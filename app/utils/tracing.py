@@ -0,0 +1,293 @@
+from typing import Any, Callable, Dict, List, Optional
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+import importlib
+import logging
+import random
+import httpx
+import json
+import time
+import re
+import os
+
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_PATTERN = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+_NOOP = nullcontext()
+
+
+class Exporter:
+    """Receives every finished, sampled trace as a list of span dicts."""
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+
+class LogExporter(Exporter):
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        logger.info(f"trace {json.dumps(spans, separators=(',', ':'))}")
+
+
+class JsonFileExporter(Exporter):
+    """Append one JSON object per span to a file, for offline analysis."""
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv('TRACE_FILE', 'traces.jsonl')
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(span, separators=(",", ":")) + "\n" for span in spans)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.error(f"Failed to write traces to {self.path}: {e}")
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "exporter")
+
+    def __init__(self, trace_id: str, exporter: Exporter):
+        self.trace_id = trace_id
+        self.spans: List[Dict[str, Any]] = []
+        self.exporter = exporter
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "attributes", "_ended")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], start_ns: Optional[int] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.attributes: Dict[str, Any] = {}
+        self._ended = False
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def child(self, name: str, start_ns: Optional[int] = None) -> "Span":
+        return Span(self.trace, name, self.span_id, start_ns)
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None, error: Optional[BaseException] = None) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        if error is not None:
+            self.attributes["error"] = repr(error)
+        self.trace.spans.append({
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(((end_ns or time.time_ns()) - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+        })
+
+
+# Active span of the current task; None when the request is not sampled,
+# which turns every instrumentation point into a cheap no-op.
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _load_exporter(spec: str) -> Optional[Exporter]:
+    if spec in ("", "none"):
+        return None
+    if spec == "log":
+        return LogExporter()
+    if spec == "file":
+        return JsonFileExporter()
+
+    # Anything else names a custom exporter class, e.g. "mypkg.otel:Exporter".
+    module_name, _, class_name = spec.partition(":")
+    try:
+        return getattr(importlib.import_module(module_name), class_name)()
+    except (ImportError, AttributeError, TypeError) as e:
+        logger.error(f"Failed to load trace exporter {spec!r}, tracing disabled: {e}")
+        return None
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[Exporter] = None, sample_rate: float = None):
+        if sample_rate is None:
+            sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None) -> Optional[Span]:
+        """Start a root span, honouring an incoming W3C traceparent.
+
+        A parent's sampled flag is respected; otherwise the request is
+        sampled with probability `sample_rate`.
+        """
+        if self.exporter is None:
+            return None
+
+        match = _TRACEPARENT_PATTERN.fullmatch(traceparent.strip().lower()) if traceparent else None
+        if match is not None:
+            if not int(match.group(3), 16) & 1:
+                return None
+            trace_id, parent_id = match.group(1), match.group(2)
+        else:
+            if random.random() >= self.sample_rate:
+                return None
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+
+        return Span(_Trace(trace_id, self.exporter), name, parent_id)
+
+    @staticmethod
+    def finish_trace(root: Span, error: Optional[BaseException] = None) -> None:
+        root.end(error=error)
+        try:
+            root.trace.exporter.export(root.trace.spans)
+        except Exception as e:
+            logger.error(f"Trace exporter failed: {e}")
+
+
+tracer = Tracer(_load_exporter(os.getenv('TRACE_EXPORTER', 'none')))
+
+
+def set_exporter(exporter: Optional[Exporter]) -> None:
+    tracer.exporter = exporter
+
+
+@contextmanager
+def _active_span(name: str, parent: Span, attributes: Dict[str, Any]):
+    span = parent.child(name)
+    span.attributes.update(attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=e)
+        raise
+    finally:
+        current_span.reset(token)
+        span.end()
+
+
+def span(name: str, **attributes: Any):
+    """Context manager timing a phase under the current span.
+
+    Yields the span, or None when the request is not being traced. Must
+    not wrap a `yield` of an async generator, since the span would leak
+    into the consumer's context; use `start_span` there instead.
+    """
+    parent = current_span.get()
+    if parent is None:
+        return _NOOP
+    return _active_span(name, parent, attributes)
+
+
+def start_span(name: str, start_ns: Optional[int] = None) -> Optional[Span]:
+    """Start a child of the current span without making it current."""
+    parent = current_span.get()
+    return parent.child(name, start_ns) if parent is not None else None
+
+
+class TracingMiddleware:
+    """Root span per HTTP request, ended after the last body chunk is sent.
+
+    Also records `request.receive` (reading the body) and, via
+    `record_validation()`, the time between the body arriving and the
+    endpoint starting, which is FastAPI's body parsing and validation.
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        root = self.tracer.start_trace(f"{scope['method']} {scope['path']}", traceparent)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        receive_span: Optional[Span] = None
+
+        async def traced_receive():
+            nonlocal receive_span
+            message = await receive()
+            if message["type"] == "http.request":
+                if receive_span is None:
+                    receive_span = root.child("request.receive")
+                    receive_span.set("bytes", 0)
+                receive_span.attributes["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    receive_span.end()
+                    root.set("body_received_ns", time.time_ns())
+            return message
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.tracer.finish_trace(root)
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, traced_receive, traced_send)
+        except BaseException as e:
+            self.tracer.finish_trace(root, error=e)
+            raise
+        finally:
+            current_span.reset(token)
+            # Covers responses that never sent a final body message.
+            if not root._ended:
+                self.tracer.finish_trace(root)
+
+
+def record_validation() -> None:
+    """Record body parsing/validation, called first thing in an endpoint."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    body_received_ns = parent.attributes.pop("body_received_ns", None)
+    if body_received_ns is not None:
+        parent.child("request.validate", body_received_ns).end()
+
+
+def _trace_callback(parent: Span) -> Callable:
+    open_spans: Dict[str, Span] = {}
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        # httpcore events look like "connection.connect_tcp.started".
+        phase, _, state = event_name.rpartition(".")
+        if state == "started":
+            open_spans[phase] = parent.child(f"http.{phase.rpartition('.')[2]}")
+        elif state in ("complete", "failed") and phase in open_spans:
+            open_spans.pop(phase).end(error=info.get("exception") if state == "failed" else None)
+
+    return trace
+
+
+async def inject_trace_context(request: httpx.Request) -> None:
+    """httpx request hook: propagate traceparent and time connection phases."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    request.headers["traceparent"] = parent.traceparent
+    request.extensions["trace"] = _trace_callback(parent)
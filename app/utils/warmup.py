@@ -0,0 +1,91 @@
+from typing import Awaitable, Dict, Optional
+from urllib.parse import urlsplit
+from .image_manager import ImageManager
+from .http_client import POE_BOT_BASE_URL
+from .request_decoder import decode_client_request
+from .token import warm_up_encoding_async
+
+import fastapi_poe as fp
+import asyncio
+import httpx
+import logging
+import time
+import os
+
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_REDIS_CONNECTIONS = int(os.getenv('WARMUP_REDIS_CONNECTIONS', '4'))
+WARMUP_POE_CONNECTIONS = int(os.getenv('WARMUP_POE_CONNECTIONS', '2'))
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', '5'))
+
+_SAMPLE_BODIES = (
+    b'{"model":"warm-up","messages":[{"role":"user","content":[{"type":"text","text":"hi"}]}]}',
+    b'{"model":"warm-up","input":[{"role":"user","content":[{"type":"input_text","text":"hi"}]}]}',
+)
+
+
+async def _open_redis_connections(image_manager: ImageManager, count: int) -> None:
+    # Concurrent commands each check out their own pooled connection.
+    await asyncio.gather(*(image_manager.redis_client.ping() for _ in range(count)))
+
+
+async def _open_poe_connections(http_client: httpx.AsyncClient, count: int) -> None:
+    # Any response leaves a connected, TLS-established socket in the pool.
+    parts = urlsplit(POE_BOT_BASE_URL)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+    await asyncio.gather(*(http_client.head(origin) for _ in range(count)))
+
+
+def _build_request_models() -> None:
+    for body in _SAMPLE_BODIES:
+        decode_client_request(body)
+    fp.ProtocolMessage(role="user", content="hi")
+
+
+async def _timed(name: str, step: Awaitable[None], timings: Dict[str, Optional[float]]) -> None:
+    started_at = time.perf_counter()
+    try:
+        await asyncio.wait_for(step, WARMUP_TIMEOUT)
+    except Exception as e:
+        timings[name] = None
+        logger.warning(f"Warm-up step {name} failed, it will happen on first use instead: {e!r}")
+        return
+    timings[name] = round(time.perf_counter() - started_at, 4)
+
+
+async def warm_up(
+    image_manager: ImageManager,
+    http_client: httpx.AsyncClient,
+    app=None
+) -> Dict[str, Optional[float]]:
+    """Pay one-off startup costs before the worker accepts traffic.
+
+    Loads the tokenizer off the event loop, opens Redis and Poe pool
+    connections and runs the request models and OpenAPI schema once, so
+    the first requests a new worker serves are not the slow ones. Steps
+    run concurrently; a failed step is logged and left to first use.
+    Returns seconds per step, None for failed ones.
+    """
+    timings: Dict[str, Optional[float]] = {}
+    if not WARMUP_ENABLED:
+        return timings
+
+    started_at = time.perf_counter()
+    steps = {
+        "tokenizer": warm_up_encoding_async(),
+        "redis": _open_redis_connections(image_manager, WARMUP_REDIS_CONNECTIONS),
+    }
+    if WARMUP_POE_CONNECTIONS > 0:
+        steps["poe"] = _open_poe_connections(http_client, WARMUP_POE_CONNECTIONS)
+    await asyncio.gather(*(_timed(name, step, timings) for name, step in steps.items()))
+
+    schema_started_at = time.perf_counter()
+    _build_request_models()
+    if app is not None:
+        app.openapi()
+    timings["schemas"] = round(time.perf_counter() - schema_started_at, 4)
+
+    logger.info(f"Warm-up finished in {time.perf_counter() - started_at:.3f}s: {timings}")
+    return timings
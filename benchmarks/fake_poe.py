@@ -0,0 +1,132 @@
+"""Local stand-in for the Poe bot query and file upload APIs.
+
+Speaks the SSE protocol `fastapi_poe.get_bot_response` consumes and the
+upload endpoint `fastapi_poe.upload_file` posts to, with tunable timing
+and error injection. Point the proxy at it with:
+
+    POE_BOT_BASE_URL=http://127.0.0.1:8910/bot/ \
+    POE_UPLOAD_BASE_URL=http://127.0.0.1:8910/poe_api/ uvicorn app.main:app
+
+    python -m benchmarks.fake_poe --ttft-ms 300 --chunks 200 --chunk-rate 50
+
+Every output token is the word "tok", so clients can count tokens by
+splitting on whitespace.
+"""
+from dataclasses import dataclass, asdict
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import uvicorn
+
+
+_PART_CONTENT_TYPE = re.compile(rb"content-type: *([^\r\n;]+)", re.IGNORECASE)
+
+
+@dataclass
+class FakePoeConfig:
+    ttft_ms: float = 200.0
+    chunks: int = 100
+    chunk_tokens: int = 3
+    chunk_rate: float = 50.0
+    error_rate: float = 0.0
+    midstream_error_rate: float = 0.0
+    upload_latency_ms: float = 50.0
+    seed: int = 0
+
+
+def create_app(config: FakePoeConfig) -> Starlette:
+    rng = random.Random(config.seed)
+    upload_ids = itertools.count()
+    chunk_text = "tok " * config.chunk_tokens
+    chunk_interval = 1.0 / config.chunk_rate if config.chunk_rate > 0 else 0.0
+
+    async def _events(fail_midway: bool):
+        await asyncio.sleep(config.ttft_ms / 1000)
+        for i in range(config.chunks):
+            if fail_midway and i == config.chunks // 2:
+                yield 'event: error\ndata: {"text": "injected failure", "allow_retry": false}\n\n'
+                return
+            yield f"event: text\ndata: {json.dumps({'text': chunk_text})}\n\n"
+            if chunk_interval:
+                await asyncio.sleep(chunk_interval)
+        yield "event: done\ndata: {}\n\n"
+
+    async def bot(request: Request) -> Response:
+        payload = await request.json()
+        if payload.get("type") != "query":
+            # report_error / report_feedback
+            return JSONResponse({})
+
+        if rng.random() < config.error_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+
+        return StreamingResponse(
+            _events(rng.random() < config.midstream_error_rate),
+            media_type="text/event-stream"
+        )
+
+    async def file_upload(request: Request) -> Response:
+        # Only the part's content type is needed; skip a multipart parser.
+        body = await request.body()
+        match = _PART_CONTENT_TYPE.search(body)
+        await asyncio.sleep(config.upload_latency_ms / 1000)
+        content_type = match.group(1).decode() if match else "application/octet-stream"
+        return JSONResponse({
+            "attachment_url": f"http://fake-poe.local/attachments/{next(upload_ids)}",
+            "mime_type": content_type,
+        })
+
+    async def show_config(request: Request) -> Response:
+        return JSONResponse(asdict(config))
+
+    return Starlette(routes=[
+        Route("/bot/{bot_name}", bot, methods=["POST"]),
+        Route("/poe_api/file_upload_3RD_PARTY_POST", file_upload, methods=["POST"]),
+        Route("/config", show_config, methods=["GET"]),
+    ])
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = FakePoeConfig()
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms)
+    parser.add_argument("--chunks", type=int, default=defaults.chunks)
+    parser.add_argument("--chunk-tokens", type=int, default=defaults.chunk_tokens)
+    parser.add_argument("--chunk-rate", type=float, default=defaults.chunk_rate, help="chunks per second, 0 for no pacing")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="share of queries answered with 503")
+    parser.add_argument("--midstream-error-rate", type=float, default=defaults.midstream_error_rate)
+    parser.add_argument("--upload-latency-ms", type=float, default=defaults.upload_latency_ms)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> FakePoeConfig:
+    return FakePoeConfig(
+        ttft_ms=args.ttft_ms,
+        chunks=args.chunks,
+        chunk_tokens=args.chunk_tokens,
+        chunk_rate=args.chunk_rate,
+        error_rate=args.error_rate,
+        midstream_error_rate=args.midstream_error_rate,
+        upload_latency_ms=args.upload_latency_ms,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8910)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
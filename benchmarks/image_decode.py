@@ -0,0 +1,69 @@
+"""Compare the data-URL image decoder against the original regex decoder.
+
+Reports peak traced memory (as a multiple of the data URL size) and
+decode throughput for a few payload sizes:
+
+    python -m benchmarks.image_decode --sizes 1 5 20
+"""
+from io import BytesIO
+from app.utils.data_url import decode_image_data_url
+
+import argparse
+import base64
+import hashlib
+import os
+import re
+import time
+import tracemalloc
+
+
+def legacy_parse_image_url(image_url: str):
+    pattern = r'^data:image/([^;,]+)(?:;[^,]*)?;base64,(.+)$'
+    match = re.match(pattern, image_url)
+    if not match:
+        raise ValueError("Invalid image data url format.")
+
+    decoded_data = base64.b64decode(match.group(2))
+    digest = hashlib.blake2b(decoded_data, digest_size=16).hexdigest()
+    return BytesIO(decoded_data), match.group(1), digest
+
+
+def current_parse_image_url(image_url: str):
+    decoded_data, image_format, digest = decode_image_data_url(image_url)
+    return BytesIO(decoded_data), image_format, digest
+
+
+def _measure(parse, data_url: str, repeat: int):
+    tracemalloc.start()
+    result = parse(data_url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(data_url)
+    elapsed = (time.perf_counter() - started) / repeat
+    return peak, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 20], help="decoded sizes in MB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'impl':>8} {'peak/url':>9} {'MB/s':>9}")
+    for size_mb in args.sizes:
+        raw = os.urandom(int(size_mb * 1024 * 1024))
+        data_url = "data:image/png;base64," + base64.b64encode(raw).decode()
+        del raw
+
+        assert legacy_parse_image_url(data_url)[2] == current_parse_image_url(data_url)[2]
+        for name, parse in (("legacy", legacy_parse_image_url), ("current", current_parse_image_url)):
+            peak, elapsed = _measure(parse, data_url, args.repeat)
+            print(f"{size_mb:>5}M {name:>8} {peak / len(data_url):>8.2f}x {len(data_url) / elapsed / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
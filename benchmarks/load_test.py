@@ -0,0 +1,287 @@
+"""End-to-end load test of the proxy against the local fake Poe.
+
+Drives `/v1/responses` and `/v1/chat/completions`, streaming and not, at a
+fixed concurrency and reports RPS, TTFT and inter-chunk percentiles, proxy
+CPU per output token and proxy RSS per open stream. With `--spawn` it
+starts `benchmarks.fake_poe` and the proxy itself (Redis must be reachable
+through REDIS_URL):
+
+    python -m benchmarks.load_test --spawn --concurrency 200 --requests 2000 \
+        --output results/baseline.json
+
+Results are written as JSON so runs can be compared. CPU and RSS are read
+from /proc and are only reported on Linux.
+"""
+from benchmarks import fake_poe
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import httpx
+
+
+ENDPOINTS = {"responses": "/v1/responses", "chat": "/v1/chat/completions"}
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+
+def _proc_cpu_seconds(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _proc_rss_kb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _build_payload(endpoint: str, stream: bool, image_kb: int, seq: int) -> dict:
+    content = [{"type": "text", "text": f"Benchmark request {seq}: write a long answer."}]
+    if image_kb:
+        # Unique bytes per request so the attachment cache does not hide uploads.
+        raw = b"\x89PNG\r\n\x1a\n" + seq.to_bytes(8, "big") + os.urandom(image_kb * 1024)
+        data_url = "data:image/png;base64," + base64.b64encode(raw).decode()
+        content.append({"type": "image_url", "image_url": {"url": data_url}})
+
+    if endpoint == "responses":
+        for item in content:
+            item["type"] = "input_text" if item["type"] == "text" else "input_image"
+            if item["type"] == "input_image":
+                item["image_url"], item["detail"] = item["image_url"]["url"], "auto"
+        return {"model": "bench-bot", "stream": stream, "input": [{"role": "user", "content": content}]}
+    return {"model": "bench-bot", "stream": stream, "messages": [{"role": "user", "content": content}]}
+
+
+def _stream_delta(endpoint: str, data: str) -> str:
+    if data == "[DONE]":
+        return ""
+    event = json.loads(data)
+    if endpoint == "responses":
+        return event.get("delta", "") if event.get("type") == "response.output_text.delta" else ""
+    choices = event.get("choices") or []
+    delta = (choices[0].get("delta") or {}) if choices else {}
+    return delta.get("content") or ""
+
+
+def _response_text(endpoint: str, body: dict) -> str:
+    if endpoint == "responses":
+        return "".join(part.get("text", "") for item in body.get("output", []) for part in item.get("content", []))
+    return ((body.get("choices") or [{}])[0].get("message") or {}).get("content") or ""
+
+
+class _Scenario:
+    def __init__(self, endpoint: str, stream: bool):
+        self.endpoint = endpoint
+        self.stream = stream
+        self.ttfts: list = []
+        self.gaps: list = []
+        self.tokens = 0
+        self.completed = 0
+        self.errors = 0
+        self.open_streams = 0
+        self.peak_open_streams = 0
+
+    async def one(self, client: httpx.AsyncClient, image_kb: int, seq: int) -> None:
+        payload = _build_payload(self.endpoint, self.stream, image_kb, seq)
+        started = time.perf_counter()
+        try:
+            if not self.stream:
+                response = await client.post(ENDPOINTS[self.endpoint], json=payload)
+                response.raise_for_status()
+                self.ttfts.append(time.perf_counter() - started)
+                self.tokens += len(_response_text(self.endpoint, response.json()).split())
+                self.completed += 1
+                return
+
+            self.open_streams += 1
+            self.peak_open_streams = max(self.peak_open_streams, self.open_streams)
+            try:
+                async with client.stream("POST", ENDPOINTS[self.endpoint], json=payload) as response:
+                    response.raise_for_status()
+                    last = None
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        text = _stream_delta(self.endpoint, line[5:].strip())
+                        if not text:
+                            continue
+                        now = time.perf_counter()
+                        if last is None:
+                            self.ttfts.append(now - started)
+                        else:
+                            self.gaps.append(now - last)
+                        last = now
+                        self.tokens += len(text.split())
+            finally:
+                self.open_streams -= 1
+            self.completed += 1
+        except (httpx.HTTPError, ValueError):
+            self.errors += 1
+
+
+async def _run_scenario(args: argparse.Namespace, scenario: _Scenario, proxy_pid) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    sequence = iter(range(args.requests))
+
+    async with httpx.AsyncClient(base_url=args.target, headers=headers, limits=limits, timeout=args.timeout) as client:
+        async def worker():
+            for seq in sequence:
+                await scenario.one(client, args.image_kb, seq)
+
+        baseline_rss = _proc_rss_kb(proxy_pid) if proxy_pid else None
+        cpu_before = _proc_cpu_seconds(proxy_pid) if proxy_pid else None
+        peak_rss = baseline_rss
+        rss_at_peak_streams = None
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        while not all(w.done() for w in workers):
+            await asyncio.sleep(0.1)
+            if proxy_pid:
+                rss = _proc_rss_kb(proxy_pid)
+                if rss is not None:
+                    peak_rss = max(peak_rss or 0, rss)
+                    if scenario.open_streams and scenario.open_streams >= scenario.peak_open_streams:
+                        rss_at_peak_streams = rss
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+    cpu_after = _proc_cpu_seconds(proxy_pid) if proxy_pid else None
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    rss_per_stream = None
+    if rss_at_peak_streams is not None and baseline_rss is not None and scenario.peak_open_streams:
+        rss_per_stream = round((rss_at_peak_streams - baseline_rss) / scenario.peak_open_streams, 1)
+
+    return {
+        "endpoint": ENDPOINTS[scenario.endpoint],
+        "stream": scenario.stream,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "completed": scenario.completed,
+        "errors": scenario.errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(scenario.completed / elapsed, 2) if elapsed else None,
+        "ttft_ms": {"p50": _ms(_percentile(scenario.ttfts, 0.5)), "p99": _ms(_percentile(scenario.ttfts, 0.99))},
+        "inter_chunk_ms": {"p50": _ms(_percentile(scenario.gaps, 0.5)), "p99": _ms(_percentile(scenario.gaps, 0.99))},
+        "output_tokens": scenario.tokens,
+        "cpu_ms_per_token": round(cpu_seconds * 1000 / scenario.tokens, 4) if cpu_seconds is not None and scenario.tokens else None,
+        "peak_rss_kb": peak_rss,
+        "peak_open_streams": scenario.peak_open_streams,
+        "rss_kb_per_open_stream": rss_per_stream,
+    }
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def _spawn(args: argparse.Namespace) -> list:
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake_cmd = [sys.executable, "-m", "benchmarks.fake_poe", "--port", str(args.fake_port)]
+    for name, value in vars(fake_poe.config_from_args(args)).items():
+        fake_cmd += [f"--{name.replace('_', '-')}", str(value)]
+
+    env = dict(
+        os.environ,
+        POE_BOT_BASE_URL=f"{fake_url}/bot/",
+        POE_UPLOAD_BASE_URL=f"{fake_url}/poe_api/",
+    )
+    proxy_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.proxy_port), "--log-level", "warning"]
+
+    processes = [subprocess.Popen(fake_cmd), subprocess.Popen(proxy_cmd, env=env, stdout=subprocess.DEVNULL)]
+    _wait_ready(f"{fake_url}/config")
+    _wait_ready(f"http://127.0.0.1:{args.proxy_port}/")
+    args.target = f"http://127.0.0.1:{args.proxy_port}"
+    args.proxy_pid = processes[1].pid
+    return processes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="http://127.0.0.1:2026", help="proxy base URL when not spawning")
+    parser.add_argument("--proxy-pid", type=int, default=None, help="proxy PID for CPU/RSS sampling when not spawning")
+    parser.add_argument("--spawn", action="store_true", help="start the fake Poe and the proxy locally")
+    parser.add_argument("--proxy-port", type=int, default=2027)
+    parser.add_argument("--fake-port", type=int, default=8910)
+    parser.add_argument("--endpoints", default="responses,chat")
+    parser.add_argument("--modes", default="stream,non-stream")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--image-kb", type=int, default=0, help="attach a unique image of this size")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--api-key", default="bench-key")
+    parser.add_argument("--output", default=None, help="write results as JSON here")
+    fake_poe.add_arguments(parser)
+    args = parser.parse_args()
+
+    processes = _spawn(args) if args.spawn else []
+    try:
+        results = []
+        for endpoint in args.endpoints.split(","):
+            for mode in args.modes.split(","):
+                scenario = _Scenario(endpoint.strip(), mode.strip() == "stream")
+                result = asyncio.run(_run_scenario(args, scenario, args.proxy_pid))
+                results.append(result)
+                print(
+                    f"{result['endpoint']:>20} {'stream' if result['stream'] else 'json':>6} "
+                    f"rps={result['rps']} ttft p50/p99={result['ttft_ms']['p50']}/{result['ttft_ms']['p99']}ms "
+                    f"gap p50/p99={result['inter_chunk_ms']['p50']}/{result['inter_chunk_ms']['p99']}ms "
+                    f"cpu/token={result['cpu_ms_per_token']}ms rss/stream={result['rss_kb_per_open_stream']}KB "
+                    f"errors={result['errors']}"
+                )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "fake_poe": vars(fake_poe.config_from_args(args)),
+            "scenarios": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""Microbenchmarks for the per-request and per-chunk hot paths.
+
+Each case is timed best-of-`--repeat`, with enough iterations per sample
+to last `--min-time` seconds, and reported in microseconds per call:
+
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --save benchmarks/baseline.json
+    python -m benchmarks.microbench --compare benchmarks/baseline.json --threshold 15
+
+`--compare` exits with status 1 when any case is slower than its baseline
+by more than the threshold. The threshold defaults to the baseline file's
+`threshold_pct` (10 if absent), and its `thresholds` map can override it
+per case; both are kept when the baseline is re-saved. Baselines are
+machine-specific, so compare only runs from the same host.
+"""
+from app.models.request_models import ClientRequest
+from app.models.openai_responses import ContentDelta, ResponseTypes
+from app.models.openai_chat_completions import Delta
+from app.services._poe_internal import ChatCompletionChunkEncoder, craete_chat_completion
+from app.services._poe_internal import create_usage, sse_handshake, sse_finalize
+from app.utils.message_mapper import _parse_image_url, to_poe_message
+from app.utils.sse_utils import SSEFormatter
+from app.utils.request_decoder import decode_client_request
+from app.utils import token as token_utils
+from fastapi_poe.types import Attachment
+from typing import Any, Callable, Dict, Tuple
+
+import fastapi_poe as fp
+import argparse
+import asyncio
+import base64
+import fnmatch
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+
+DEFAULT_THRESHOLD_PCT = 10.0
+
+_WORDS = ["latency", "stream", "poe", "token", "budget", "socket", "worker", "event", "loop", "chunk"]
+_rng = random.Random(0)
+
+
+def _text(approx_chars: int) -> str:
+    words = []
+    length = 0
+    while length < approx_chars:
+        word = f"{_rng.choice(_WORDS)}{_rng.randint(0, 999)}"
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def _data_url(size_bytes: int) -> str:
+    raw = b"\x89PNG\r\n\x1a\n" + os.urandom(size_bytes)
+    return "data:image/png;base64," + base64.b64encode(raw).decode()
+
+
+def _conversation(turns: int, chars: int):
+    roles = ["user", "assistant"]
+    return [{"role": "system", "content": "You are a helpful assistant."}] + [
+        {"role": roles[i % 2], "content": _text(chars)} for i in range(turns)
+    ]
+
+
+def _protocol_history(turns: int, chars: int):
+    return [
+        fp.ProtocolMessage(role=("user" if i % 2 == 0 else "bot"), content=_text(chars))
+        for i in range(turns)
+    ]
+
+
+class _WarmImageManager:
+    """Attachment cache that always hits, so only local work is timed."""
+
+    attachment = Attachment(url="https://pfst.cf2.poecdn.net/base/image/bench", content_type="image/png", name="bench.png")
+
+    async def get_or_create_attachment(self, image_digest: str, create) -> Attachment:
+        return self.attachment
+
+
+# A case builder returns (callable, is_async). Builders run only for the
+# selected cases, so large fixtures are not allocated needlessly.
+Builder = Callable[[], Tuple[Callable[[], Any], bool]]
+
+
+def _request_body(shape: str, image_bytes: int) -> bytes:
+    conversation = _conversation(20, 400)
+    data_url = _data_url(image_bytes)
+    if shape == "messages":
+        conversation[-1]["content"] = [
+            {"type": "text", "text": "Describe this image."},
+            {"type": "image_url", "image_url": {"url": data_url}},
+        ]
+    else:
+        conversation[-1]["content"] = [
+            {"type": "input_text", "text": "Describe this image."},
+            {"type": "input_image", "detail": "auto", "image_url": data_url},
+        ]
+    return json.dumps({"model": "GPT-4o", "stream": True, shape: conversation}).encode()
+
+
+def _validate_request(shape: str, image_bytes: int) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        # Validators rewrite the payload in place, so decode a fresh copy
+        # each time, as FastAPI does.
+        body = _request_body(shape, image_bytes)
+        return lambda: ClientRequest.model_validate(json.loads(body)), False
+    return build
+
+
+def _decode_request(shape: str, image_bytes: int) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        body = _request_body(shape, image_bytes)
+        return lambda: decode_client_request(body), False
+    return build
+
+
+def _to_poe_message(with_image: bool) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        conversation = _conversation(20, 400)
+        if with_image:
+            conversation[-1]["content"] = [
+                {"type": "input_text", "text": "Describe this image."},
+                {"type": "input_image", "detail": "auto", "image_url": _data_url(256 * 1024)},
+            ]
+        request = ClientRequest.model_validate({"model": "GPT-4o", "input": conversation})
+        image_manager = _WarmImageManager()
+        return lambda: to_poe_message(request.input, "bench-key", image_manager), True
+    return build
+
+
+def _parse_image(size_mb: int) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        data_url = _data_url(size_mb * 1024 * 1024)
+        return lambda: _parse_image_url(data_url), False
+    return build
+
+
+def _responses_delta() -> Tuple[Callable, bool]:
+    sse_formatter = SSEFormatter()
+    text_chunk = _text(24)
+
+    def run():
+        delta_data = ContentDelta(
+            type=ResponseTypes.OUTPUT_TEXT_DELTA.value,
+            item_id="msg-bench",
+            delta=text_chunk
+        )
+        return sse_formatter.format_reponse(ResponseTypes.OUTPUT_TEXT_DELTA.value, delta_data.to_dict())
+
+    return run, False
+
+
+_CHAT_BASE_ARGS = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion.chunk",
+    "system_fingerprint": "fp_bench",
+    "model": "GPT-4o",
+}
+
+
+def _chat_chunk_encoder() -> Tuple[Callable, bool]:
+    chunk_encoder = ChatCompletionChunkEncoder(_CHAT_BASE_ARGS)
+    text_chunk = _text(24)
+    return lambda: chunk_encoder.encode(text_chunk), False
+
+
+def _chat_chunk_model() -> Tuple[Callable, bool]:
+    sse_formatter = SSEFormatter()
+    text_chunk = _text(24)
+
+    def run():
+        payload = craete_chat_completion(base_args=_CHAT_BASE_ARGS.copy(), delta=Delta(content=text_chunk))
+        return sse_formatter.format_chat_completion(payload.to_dict())
+
+    return run, False
+
+
+_RESPONSE_BASE_ARGS = {
+    "id": "resp-bench", "model": "GPT-4o",
+    "instructions": "You are a helpful assistant.", "temperature": None,
+    "previous_response_id": None, "store": True
+}
+
+
+def _handshake() -> Tuple[Callable, bool]:
+    sse_formatter = SSEFormatter()
+
+    async def run():
+        async for _ in sse_handshake(sse_formatter, _RESPONSE_BASE_ARGS, "msg-bench"):
+            pass
+
+    return run, True
+
+
+def _finalize(output_chars: int) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        sse_formatter = SSEFormatter()
+        accumulated_text = _text(output_chars)
+        protocol_messages = _protocol_history(10, 400)
+
+        async def run():
+            async for _ in sse_finalize(
+                sse_formatter, _RESPONSE_BASE_ARGS, "msg-bench",
+                accumulated_text, protocol_messages
+            ):
+                pass
+
+        return run, True
+    return build
+
+
+def _usage(turns: int, cold: bool) -> Builder:
+    def build() -> Tuple[Callable, bool]:
+        protocol_messages = _protocol_history(turns, 2000)
+        output_text = _text(4000)
+
+        async def run():
+            if cold:
+                token_utils._token_count_cache.clear()
+            return await create_usage(protocol_messages, output_text)
+
+        return run, True
+    return build
+
+
+CASES: Dict[str, Builder] = {
+    "request.validate.messages": _validate_request("messages", 64 * 1024),
+    "request.validate.input": _validate_request("input", 64 * 1024),
+    "request.validate.input.5mb": _validate_request("input", 5 * 1024 * 1024),
+    "request.decode.messages": _decode_request("messages", 64 * 1024),
+    "request.decode.input": _decode_request("input", 64 * 1024),
+    "request.decode.input.5mb": _decode_request("input", 5 * 1024 * 1024),
+    "request.to_poe_message.text": _to_poe_message(with_image=False),
+    "request.to_poe_message.cached_image": _to_poe_message(with_image=True),
+    "image.parse.1mb": _parse_image(1),
+    "image.parse.5mb": _parse_image(5),
+    "image.parse.20mb": _parse_image(20),
+    "chunk.responses.delta": _responses_delta,
+    "chunk.chat.encoder": _chat_chunk_encoder,
+    "chunk.chat.model": _chat_chunk_model,
+    "responses.handshake": _handshake,
+    "responses.finalize.1k": _finalize(1_000),
+    "responses.finalize.32k": _finalize(32_000),
+    "responses.finalize.256k": _finalize(256_000),
+    "usage.history_200.warm": _usage(200, cold=False),
+    "usage.history_200.cold": _usage(200, cold=True),
+}
+
+
+def _run_sync(fn: Callable, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - started
+
+
+async def _run_async(fn: Callable, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        await fn()
+    return time.perf_counter() - started
+
+
+async def _measure(fn: Callable, is_async: bool, min_time: float, repeat: int) -> float:
+    async def sample(loops: int) -> float:
+        return await _run_async(fn, loops) if is_async else _run_sync(fn, loops)
+
+    # Warm caches and lazy imports before calibrating.
+    await sample(1)
+    loops = 1
+    while True:
+        elapsed = await sample(loops)
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+
+    samples = [elapsed / loops]
+    for _ in range(repeat - 1):
+        samples.append(await sample(loops) / loops)
+    return min(samples) * 1e6
+
+
+def run_cases(names, min_time: float, repeat: int, verbose: bool = True) -> Dict[str, float]:
+    results = {}
+    for name in names:
+        fn, is_async = CASES[name]()
+        results[name] = round(asyncio.run(_measure(fn, is_async, min_time, repeat)), 3)
+        if verbose:
+            print(f"{name:<40} {results[name]:>12.3f} us")
+    return results
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, float]) -> None:
+    previous = _load(path) if os.path.exists(path) else {}
+    baseline = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "threshold_pct": previous.get("threshold_pct", DEFAULT_THRESHOLD_PCT),
+        "thresholds": previous.get("thresholds", {}),
+        # Keep cases that were not part of this (filtered) run.
+        "results_us": {**previous.get("results_us", {}), **results},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Baseline written to {path}")
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, float], threshold_pct: float = None) -> bool:
+    """Print a comparison table; return False if any case regressed."""
+    if threshold_pct is None:
+        threshold_pct = baseline.get("threshold_pct", DEFAULT_THRESHOLD_PCT)
+    thresholds = baseline.get("thresholds", {})
+    reference = baseline.get("results_us", {})
+
+    regressions = []
+    print(f"{'case':<40} {'baseline us':>12} {'current us':>12} {'change':>9}")
+    for name, current in results.items():
+        previous = reference.get(name)
+        if not previous:
+            print(f"{name:<40} {'-':>12} {current:>12.3f} {'new':>9}")
+            continue
+
+        change_pct = (current - previous) / previous * 100
+        limit = thresholds.get(name, threshold_pct)
+        flag = ""
+        if change_pct > limit:
+            regressions.append(name)
+            flag = f"  REGRESSION (> {limit:g}%)"
+        print(f"{name:<40} {previous:>12.3f} {current:>12.3f} {change_pct:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed: {', '.join(regressions)}")
+    return not regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", "--select", action="append", default=None,
+                        help="glob of case names to run, may be repeated")
+    parser.add_argument("--list", action="store_true", help="list case names and exit")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per sample")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="PATH", help="write results as the baseline at PATH")
+    parser.add_argument("--compare", metavar="PATH", help="compare against the baseline at PATH")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="allowed slowdown in percent, overrides the baseline's threshold_pct")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(CASES))
+        return
+
+    names = [
+        name for name in CASES
+        if not args.select or any(fnmatch.fnmatchcase(name, pattern) for pattern in args.select)
+    ]
+    if not names:
+        parser.error("no case matches --select")
+
+    baseline = _load(args.compare) if args.compare else None
+    results = run_cases(names, args.min_time, args.repeat, verbose=baseline is None)
+    ok = compare(baseline, results, args.threshold) if baseline is not None else True
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
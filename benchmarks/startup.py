@@ -0,0 +1,146 @@
+"""Cold-start cost of a proxy worker.
+
+Starts the proxy `--runs` times against the local fake Poe and reports,
+as medians, how long `import app.main` takes, how long until the worker
+answers `/`, and the latency of its first and second real requests:
+
+    python -m benchmarks.startup --runs 5 --output results/startup.json
+    python -m benchmarks.startup --runs 5 --no-warmup
+
+`--no-warmup` sets WARMUP_ENABLED=false, so the two runs show what the
+lifespan warm-up moves out of the first request. Redis must be reachable
+through REDIS_URL.
+"""
+from benchmarks import fake_poe
+from benchmarks.load_test import ENDPOINTS, _build_payload, _wait_ready
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def _import_seconds(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _wait_listening(url: str, timeout: float) -> float:
+    started_at = time.perf_counter()
+    deadline = started_at + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def _request_ms(client: httpx.Client, url: str, payload: dict) -> float:
+    started_at = time.perf_counter()
+    response = client.post(url, json=payload)
+    elapsed = (time.perf_counter() - started_at) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} answered {response.status_code}: {response.text[:200]}")
+    return round(elapsed, 2)
+
+
+def _run_once(args: argparse.Namespace, env: dict) -> dict:
+    base_url = f"http://127.0.0.1:{args.proxy_port}"
+    proxy_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.proxy_port), "--log-level", "warning"]
+
+    started_at = time.perf_counter()
+    proxy = subprocess.Popen(proxy_cmd, env=env, stdout=subprocess.DEVNULL)
+    try:
+        ready_at = _wait_listening(f"{base_url}/", args.timeout)
+        url = base_url + ENDPOINTS[args.endpoint]
+        payload = _build_payload(args.endpoint, False, 0, 0)
+        with httpx.Client(timeout=args.timeout, headers={"Authorization": f"Bearer {args.api_key}"}) as client:
+            first_ms = _request_ms(client, url, payload)
+            second_ms = _request_ms(client, url, payload)
+    finally:
+        proxy.terminate()
+        proxy.wait()
+
+    return {
+        "ready_s": round(ready_at - started_at, 3),
+        "first_request_ms": first_ms,
+        "second_request_ms": second_ms,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="responses")
+    parser.add_argument("--no-warmup", action="store_true", help="start workers with WARMUP_ENABLED=false")
+    parser.add_argument("--proxy-port", type=int, default=2027)
+    parser.add_argument("--fake-port", type=int, default=8910)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--api-key", default="bench-key")
+    parser.add_argument("--output", default=None, help="write results as JSON here")
+    fake_poe.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    fake_cmd = [sys.executable, "-m", "benchmarks.fake_poe", "--port", str(args.fake_port)]
+    for name, value in vars(fake_poe.config_from_args(args)).items():
+        fake_cmd += [f"--{name.replace('_', '-')}", str(value)]
+    env = dict(
+        os.environ,
+        POE_BOT_BASE_URL=f"{fake_url}/bot/",
+        POE_UPLOAD_BASE_URL=f"{fake_url}/poe_api/",
+        WARMUP_ENABLED="false" if args.no_warmup else os.getenv("WARMUP_ENABLED", "true"),
+    )
+
+    fake = subprocess.Popen(fake_cmd)
+    try:
+        _wait_ready(f"{fake_url}/config")
+        runs = []
+        for run in range(args.runs):
+            result = {"import_s": round(_import_seconds(env), 3), **_run_once(args, env)}
+            runs.append(result)
+            print(
+                f"run {run + 1}/{args.runs}: import={result['import_s']}s ready={result['ready_s']}s "
+                f"first={result['first_request_ms']}ms second={result['second_request_ms']}ms"
+            )
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+    print(
+        f"median: import={summary['import_s']}s ready={summary['ready_s']}s "
+        f"first={summary['first_request_ms']}ms second={summary['second_request_ms']}ms"
+    )
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "endpoint": args.endpoint,
+            "warmup": not args.no_warmup,
+            "fake_poe": vars(fake_poe.config_from_args(args)),
+            "median": summary,
+            "runs": runs,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Inter-chunk latency of concurrent streams while large prompts are tokenized.
+
+Simulates `--streams` SSE streams that each emit a chunk every
+`--interval-ms`, while finalize-style usage counting runs on a large
+prompt, either inline on the event loop or through `count_tokens_many`:
+
+    python -m benchmarks.tokenize_latency --prompt-tokens 100000
+"""
+from app.utils import token as token_utils
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+
+def _make_prompt(approx_tokens: int, seed: int) -> str:
+    rng = random.Random(seed)
+    words = ["latency", "stream", "poe", "token", "budget", "socket", "worker", "event", "loop", "chunk"]
+    return " ".join(f"{rng.choice(words)}{rng.randint(0, 999)}" for _ in range(approx_tokens // 2))
+
+
+async def _stream(interval: float, stop: asyncio.Event, gaps: list) -> None:
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+async def _finalize_inline(prompt: str, model: str) -> None:
+    token_utils.count_tokens(prompt, model)
+
+
+async def _finalize_offloaded(prompt: str, model: str) -> None:
+    await token_utils.count_tokens_many([prompt], model)
+
+
+async def _run(mode: str, args: argparse.Namespace) -> list:
+    finalize = _finalize_inline if mode == "inline" else _finalize_offloaded
+    # Distinct prompts so the token cache never short-circuits the work.
+    prompts = [_make_prompt(args.prompt_tokens, seed) for seed in range(args.finalizes)]
+    token_utils.get_encoding(args.model)
+
+    stop = asyncio.Event()
+    gaps: list = []
+    streams = [asyncio.create_task(_stream(args.interval_ms / 1000, stop, gaps)) for _ in range(args.streams)]
+
+    for prompt in prompts:
+        await finalize(prompt, args.model)
+        await asyncio.sleep(args.interval_ms / 1000)
+
+    stop.set()
+    await asyncio.gather(*streams)
+    return gaps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    parser.add_argument("--prompt-tokens", type=int, default=100_000)
+    parser.add_argument("--finalizes", type=int, default=10)
+    parser.add_argument("--model", default="gpt-4o")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in ("inline", "offloaded"):
+        gaps = sorted(asyncio.run(_run(mode, args)))
+        p99 = gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))]
+        print(f"{mode:>10} {statistics.median(gaps) * 1000:>8.2f} {p99 * 1000:>8.2f} {gaps[-1] * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+import fastapi_poe as fp
+import httpx
+import pytest
+
+from app.services._retry_policy import is_retryable
+
+
+def _bot_error(allow_retry: bool) -> BaseException:
+    """Run a real fastapi_poe request against a bot that answers with an `error` event."""
+    body = f"event: error\ndata: {json.dumps({'text': 'overloaded', 'allow_retry': allow_retry})}\n\n"
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    async def run() -> BaseException:
+        query = fp.QueryRequest(
+            query=[fp.ProtocolMessage(role="user", content="hi")],
+            user_id="", conversation_id="", message_id="", version="1.1", type="query"
+        )
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as session:
+            with pytest.raises(fp.client.BotError) as exc_info:
+                async for _ in fp.stream_request(
+                    query, "bot", "key", session=session, num_tries=1, base_url="http://poe.test/bot/"
+                ):
+                    pass
+        return exc_info.value
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("allow_retry, expected", [(True, True), (False, False)])
+def test_bot_error_event_follows_allow_retry(allow_retry, expected):
+    assert is_retryable(_bot_error(allow_retry)) is expected
+
+
+def test_bot_error_wrapping_client_error_is_not_retried():
+    request = httpx.Request("POST", "http://poe.test/bot/bot")
+    cause = httpx.HTTPStatusError("denied", request=request, response=httpx.Response(401, request=request))
+    try:
+        raise fp.client.BotError("Error communicating with bot bot") from cause
+    except fp.client.BotError as e:
+        assert is_retryable(e) is False